@@ -1,9 +1,12 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackContext
-from database import get_db_session, User, Project, Task, UserTask, UserProject, AdminAction
+import repository as repo
 import keyboards as kb
+import callback_codec as cd
 import states
+from router import CallbackRouter
+from middleware import current_user
 from datetime import datetime, timedelta
 import utils
 
@@ -12,68 +15,70 @@ logger = logging.getLogger(__name__)
 class AdminHandlers:
     def __init__(self, application):
         self.application = application
+        self.router = self.setup_routes()
     
-    async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        query = update.callback_query
-        await query.answer()
-        
-        data = query.data
+    def setup_routes(self):
+        """Таблица callback'ов админки: обработчик получает (query, context, *аргументы)"""
+        router = CallbackRouter('admin')
         
         # Основное меню админки
-        if data == "admin_main":
-            await self.show_admin_main_menu(query)
-        elif data == "admin_projects":
-            await self.show_projects_management(query)
-        elif data == "admin_manage":
-            await self.show_admin_management(query)
-        elif data == "admin_create_task":
-            await self.start_create_task(query, context)
-        elif data == "admin_view_answers":
-            await self.show_admin_view_answers(query)
-        elif data == "admin_users":
-            await self.show_user_management(query)
-        elif data == "admin_broadcast":
-            await self.start_broadcast(query, context)
-        elif data == "admin_archive":
-            await self.show_archive(query)
-        elif data == "exit_admin":
-            await query.edit_message_text("👋 Вы вышли из админ-панели")
-            return states.ConversationHandler.END
+        router.add("admin_main", lambda query, context: self.show_admin_main_menu(query))
+        router.add("admin_projects", lambda query, context: self.show_projects_management(query))
+        router.add("admin_manage", lambda query, context: self.show_admin_management(query))
+        router.add("admin_create_task", self.start_create_task)
+        router.add("admin_view_answers", lambda query, context: self.show_admin_view_answers(query))
+        router.add("admin_broadcast", self.start_broadcast)
+        router.add("admin_archive", lambda query, context: self.show_archive(query))
+        router.add("admin_archive_{dir}_{int}", lambda query, context, direction, cursor: self.show_archive(query, direction, cursor))
+        router.add("admin_broadcast_users_{dir}_{int}", lambda query, context, direction, cursor: self.show_broadcast_users(query, direction, cursor))
+        router.add("exit_admin", lambda query, context: self.exit_admin(query))
         
         # Управление проектами
-        elif data == "projects_list":
-            await self.show_projects_list(query)
-        elif data == "project_create":
-            await self.start_create_project(query, context)
-        elif data.startswith("project_detail_"):
-            project_id = int(data.split('_')[2])
-            await self.show_project_detail(query, project_id)
-        elif data.startswith("project_users_"):
-            project_id = int(data.split('_')[2])
-            await self.show_project_users(query, project_id)
-        elif data.startswith("project_tasks_"):
-            project_id = int(data.split('_')[2])
-            await self.show_project_tasks(query, project_id)
-        elif data.startswith("project_archive_"):
-            project_id = int(data.split('_')[2])
-            await self.confirm_archive_project(query, project_id)
-        elif data.startswith("project_add_board_"):
-            project_id = int(data.split('_')[3])
-            await self.start_add_project_board(query, context, project_id)
+        router.add("projects_list", lambda query, context: self.show_projects_list(query))
+        router.add("projects_list_{dir}_{int}", lambda query, context, direction, cursor: self.show_projects_list(query, direction, cursor))
+        router.add("project_create", self.start_create_project)
+        router.add("project_detail_{int}", lambda query, context, project_id: self.show_project_detail(query, project_id))
+        router.add("project_archive_{int}", lambda query, context, project_id: self.confirm_archive_project(query, project_id))
         
         # Управление админами
-        elif data == "admin_add":
-            await self.start_add_admin(query, context)
-        elif data == "admin_remove":
-            await self.start_remove_admin(query, context)
-        elif data == "admin_list":
-            await self.show_admin_list(query)
+        router.add("admin_add", self.start_add_admin)
+        router.add("admin_remove", self.start_remove_admin)
+        router.add("admin_list", lambda query, context: self.show_admin_list(query))
+        router.add("admin_list_{dir}_{int}", lambda query, context, direction, cursor: self.show_admin_list(query, direction, cursor))
         
         # Подтверждение действий
-        elif data.startswith("confirm_"):
-            await self.handle_confirmation(query, data)
-        elif data == "cancel_action":
-            await query.edit_message_text("❌ Действие отменено", reply_markup=kb.back_button("admin_main"))
+        router.add("confirm_archive_project_{int}", lambda query, context, project_id: self.archive_project(query, project_id))
+        router.add("confirm_approve_answer_{int}", lambda query, context, user_task_id: self.approve_answer(query, user_task_id))
+        router.add("confirm_reject_answer_{int}", lambda query, context, user_task_id: self.reject_answer(query, user_task_id))
+        router.add("cancel_action", lambda query, context: self.cancel_action(query))
+        return router
+    
+    async def handle_admin_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        await query.answer()
+        
+        # Результат обработчика - новое состояние диалога (или None)
+        _, next_state = await self.router.dispatch(query.data, query, context)
+        return next_state
+    
+    async def open_view_answers(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка сводки для админов: открывает ответы на проверке и вне админ-панели"""
+        query = update.callback_query
+        user = await current_user(update, context)
+        if not user or user.role != 'admin':
+            await query.answer("⛔ Доступно только администраторам", show_alert=True)
+            return states.ConversationHandler.END
+        
+        await query.answer()
+        await self.show_admin_view_answers(query)
+        return states.ADMIN_MENU
+    
+    async def exit_admin(self, query):
+        await query.edit_message_text("👋 Вы вышли из админ-панели")
+        return states.ConversationHandler.END
+    
+    async def cancel_action(self, query):
+        await query.edit_message_text("❌ Действие отменено", reply_markup=kb.back_button("admin_main"))
     
     async def show_admin_main_menu(self, query):
         await query.edit_message_text(
@@ -89,62 +94,56 @@ class AdminHandlers:
             reply_markup=kb.projects_management_menu()
         )
     
-    async def show_projects_list(self, query):
-        session = get_db_session()
-        try:
-            projects = session.query(Project).filter(Project.is_archived == False).all()
-            
-            if not projects:
-                await query.edit_message_text(
-                    "📁 Проектов пока нет.\n\nСоздайте первый проект!",
-                    reply_markup=kb.back_button("admin_projects")
-                )
-                return
-            
-            text = "📁 Активные проекты:\n\n"
-            keyboard = []
-            
-            for project in projects:
-                participants_count = session.query(UserProject).filter(UserProject.project_id == project.id).count()
-                tasks_count = session.query(Task).filter(Task.project_id == project.id, Task.is_active == True).count()
-                
-                text += f"📂 {project.name}\n"
-                text += f"   👥 Участников: {participants_count}\n"
-                text += f"   📝 Заданий: {tasks_count}\n"
-                text += f"   📅 Создан: {project.created_at.strftime('%d.%m.%Y')}\n\n"
-                
-                keyboard.append([
-                    InlineKeyboardButton(f"📋 {project.name}", callback_data=f"project_detail_{project.id}")
-                ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_projects")])
-            
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
+    async def show_projects_list(self, query, direction='next', cursor=None):
+        page = await repo.get_projects_overview(archived=False, cursor=cursor, direction=direction)
+        
+        if not page.rows:
+            await query.edit_message_text(
+                "📁 Проектов пока нет.\n\nСоздайте первый проект!",
+                reply_markup=kb.back_button("admin_projects")
+            )
+            return
+        
+        text = "📁 Активные проекты:\n\n"
+        keyboard = []
+        
+        for project, participants_count, tasks_count, pending_count in page.rows:
+            text += f"📂 {project.name}\n"
+            text += f"   👥 Участников: {participants_count}\n"
+            text += f"   📝 Заданий: {tasks_count}\n"
+            if pending_count:
+                text += f"   ⏳ Ответов на проверке: {pending_count}\n"
+            text += f"   📅 Создан: {project.created_at.strftime('%d.%m.%Y')}\n\n"
+            
+            keyboard.append([
+                InlineKeyboardButton(f"📋 {project.name}", callback_data=cd.encode("project_detail_{int}", project.id))
+            ])
+        
+        navigation = kb.pagination_buttons("projects_list", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_projects"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     async def show_project_detail(self, query, project_id):
-        session = get_db_session()
-        try:
-            project = session.query(Project).filter(Project.id == project_id).first()
-            if not project:
-                await query.edit_message_text("❌ Проект не найдено")
-                return
-            
-            participants_count = session.query(UserProject).filter(UserProject.project_id == project.id).count()
-            tasks_count = session.query(Task).filter(Task.project_id == project.id, Task.is_active == True).count()
-            
-            text = f"📂 Проект: {project.name}\n\n"
-            text += f"📝 Описание: {project.description or 'Не указано'}\n"
-            text += f"🔗 Доска: {project.board_link or 'Не указана'}\n"
-            text += f"👥 Участников: {participants_count}\n"
-            text += f"📝 Активных заданий: {tasks_count}\n"
-            text += f"📅 Создан: {project.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-            text += "Выберите действие:"
-            
-            await query.edit_message_text(text, reply_markup=kb.project_actions_menu(project_id))
-        finally:
-            session.close()
+        overview = await repo.get_project_overview(project_id)
+        if not overview:
+            await query.edit_message_text("❌ Проект не найдено")
+            return
+        
+        project, participants_count, tasks_count, pending_count = overview
+        
+        text = f"📂 Проект: {project.name}\n\n"
+        text += f"📝 Описание: {project.description or 'Не указано'}\n"
+        text += f"🔗 Доска: {project.board_link or 'Не указана'}\n"
+        text += f"👥 Участников: {participants_count}\n"
+        text += f"📝 Активных заданий: {tasks_count}\n"
+        text += f"⏳ Ответов на проверке: {pending_count}\n"
+        text += f"📅 Создан: {project.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
+        text += "Выберите действие:"
+        
+        await query.edit_message_text(text, reply_markup=kb.project_actions_menu(project_id))
     
     async def start_create_project(self, query, context):
         context.user_data['create_project'] = {}
@@ -181,29 +180,24 @@ class AdminHandlers:
             context.user_data['create_project']['board_link'] = board_link
         
         # Сохраняем проект в базу
-        session = get_db_session()
         try:
-            admin_user = utils.get_user_by_telegram_id(update.effective_user.id)
-            
-            project = Project(
-                name=context.user_data['create_project']['name'],
-                description=context.user_data['create_project']['description'],
-                board_link=context.user_data['create_project'].get('board_link'),
-                created_by=admin_user.id
-            )
-            
-            session.add(project)
-            session.commit()
-            
-            # Логируем действие
-            admin_action = AdminAction(
-                admin_id=admin_user.id,
-                action_type='create_project',
-                target_id=project.id,
-                details=f"Создан проект: {project.name}"
-            )
-            session.add(admin_action)
-            session.commit()
+            admin_user = await current_user(update, context)
+            
+            # Проект и запись в журнале действий - одной транзакцией
+            async with repo.unit_of_work():
+                project = await repo.create_project(
+                    admin_user.id,
+                    context.user_data['create_project']['name'],
+                    context.user_data['create_project']['description'],
+                    context.user_data['create_project'].get('board_link')
+                )
+                
+                await repo.log_admin_action(
+                    admin_user.id,
+                    'create_project',
+                    project.id,
+                    f"Создан проект: {project.name}"
+                )
             
             await update.message.reply_text(
                 f"✅ Проект '{project.name}' успешно создан!",
@@ -216,33 +210,27 @@ class AdminHandlers:
         except Exception as e:
             logger.error(f"Error creating project: {e}")
             await update.message.reply_text("❌ Ошибка при создании проекта")
-        finally:
-            session.close()
         
         return states.ConversationHandler.END
     
     async def start_create_task(self, query, context):
-        session = get_db_session()
-        try:
-            projects = session.query(Project).filter(Project.is_archived == False).all()
-            
-            if not projects:
-                await query.edit_message_text(
-                    "❌ Нет активных проектов. Сначала создайте проект!",
-                    reply_markup=kb.back_button("admin_main")
-                )
-                return states.ConversationHandler.END
-            
-            context.user_data['create_task'] = {}
-            
+        projects = await repo.get_projects(archived=False)
+        
+        if not projects:
             await query.edit_message_text(
-                "📝 Создание нового задания\n\n"
-                "Выберите проект:",
-                reply_markup=kb.projects_list_keyboard(projects, "select_project_task")
+                "❌ Нет активных проектов. Сначала создайте проект!",
+                reply_markup=kb.back_button("admin_main")
             )
-            return states.CREATE_TASK_PROJECT
-        finally:
-            session.close()
+            return states.ConversationHandler.END
+        
+        context.user_data['create_task'] = {}
+        
+        await query.edit_message_text(
+            "📝 Создание нового задания\n\n"
+            "Выберите проект:",
+            reply_markup=kb.projects_list_keyboard(projects, "select_project_task")
+        )
+        return states.CREATE_TASK_PROJECT
     
     async def handle_create_task_project(self, update: Update, context: ContextTypes.DEFAULT_TYPE, project_id):
         context.user_data['create_task']['project_id'] = project_id
@@ -306,7 +294,6 @@ class AdminHandlers:
     async def handle_create_task_deadline(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         deadline_text = update.message.text
         
-        session = get_db_session()
         try:
             # Парсим дедлайн
             deadline = None
@@ -322,57 +309,28 @@ class AdminHandlers:
             
             # Получаем данные для создания задания
             project_id = context.user_data['create_task']['project_id']
-            admin_user = utils.get_user_by_telegram_id(update.effective_user.id)
-            
-            # Создаем задание
-            task = Task(
-                project_id=project_id,
-                title=context.user_data['create_task']['title'],
-                description=context.user_data['create_task']['description'],
-                deadline=deadline,
-                created_by=admin_user.id
-            )
-            
-            # Обрабатываем целевых пользователей
-            target_text = context.user_data['create_task']['target']
-            target_users = []
-            
-            if target_text.lower() == 'всем':
-                # Назначаем всем участникам проекта
-                project_users = session.query(UserProject).filter(UserProject.project_id == project_id).all()
-                target_users = [up.user_id for up in project_users]
-            else:
-                # Ищем пользователей по username
-                usernames = [username.strip('@') for username in target_text.split() if username.startswith('@')]
-                for username in usernames:
-                    user = session.query(User).filter(User.username == username).first()
-                    if user:
-                        # Проверяем, что пользователь в проекте
-                        user_project = session.query(UserProject).filter(
-                            UserProject.user_id == user.id,
-                            UserProject.project_id == project_id
-                        ).first()
-                        if user_project:
-                            target_users.append(user.id)
+            admin_user = await current_user(update, context)
             
-            task.target_users = target_users
-            
-            # Сохраняем задание
-            session.add(task)
-            session.commit()
-            
-            # Логируем действие
-            admin_action = AdminAction(
-                admin_id=admin_user.id,
-                action_type='create_task',
-                target_id=task.id,
-                details=f"Создано задание: {task.title} для проекта {task.project_id}"
-            )
-            session.add(admin_action)
-            session.commit()
-            
-            # Отправляем уведомления пользователям
-            await self.notify_users_about_new_task(task, target_users)
+            # Задание, назначения, уведомления и запись в журнале - одной транзакцией
+            async with repo.unit_of_work():
+                target_text = context.user_data['create_task']['target']
+                target_users = await repo.resolve_task_targets(project_id, target_text)
+                
+                task = await repo.create_task(
+                    admin_user.id,
+                    project_id,
+                    context.user_data['create_task']['title'],
+                    context.user_data['create_task']['description'],
+                    deadline,
+                    target_users
+                )
+                
+                await repo.log_admin_action(
+                    admin_user.id,
+                    'create_task',
+                    task.id,
+                    f"Создано задание: {task.title} для проекта {task.project_id}"
+                )
             
             await update.message.reply_text(
                 f"✅ Задание '{task.title}' успешно создано и отправлено {len(target_users)} пользователям!",
@@ -385,75 +343,34 @@ class AdminHandlers:
         except Exception as e:
             logger.error(f"Error creating task: {e}")
             await update.message.reply_text("❌ Ошибка при создании задания")
-        finally:
-            session.close()
         
         return states.ConversationHandler.END
     
-    async def notify_users_about_new_task(self, task, target_user_ids):
-        session = get_db_session()
-        try:
-            for user_id in target_user_ids:
-                user = session.query(User).filter(User.id == user_id).first()
-                if user:
-                    try:
-                        message = f"🎯 Новое задание!\n\n"
-                        message += f"📂 Проект: {session.query(Project).filter(Project.id == task.project_id).first().name}\n"
-                        message += f"📝 {task.title}\n"
-                        message += f"📄 {task.description}\n"
-                        if task.deadline:
-                            message += f"⏰ Дедлайн: {task.deadline.strftime('%d.%m.%Y %H:%M')}\n"
-                        
-                        keyboard = InlineKeyboardMarkup([[
-                            InlineKeyboardButton("📋 Перейти к заданию", callback_data=f"task_detail_{task.id}")
-                        ]])
-                        
-                        await self.application.bot.send_message(
-                            chat_id=user.user_id,
-                            text=message,
-                            reply_markup=keyboard
-                        )
-                    except Exception as e:
-                        logger.error(f"Error notifying user {user.user_id}: {e}")
-        finally:
-            session.close()
-    
     async def show_admin_view_answers(self, query):
-        session = get_db_session()
-        try:
-            # Получаем задания с ответами
-            tasks_with_answers = session.query(Task).join(UserTask).filter(
-                UserTask.status == 'pending'
-            ).distinct().all()
-            
-            if not tasks_with_answers:
-                await query.edit_message_text(
-                    "📊 Ответов для проверки пока нет.",
-                    reply_markup=kb.back_button("admin_main")
-                )
-                return
-            
-            text = "📊 Ответы для проверки:\n\n"
-            keyboard = []
-            
-            for task in tasks_with_answers:
-                pending_count = session.query(UserTask).filter(
-                    UserTask.task_id == task.id,
-                    UserTask.status == 'pending'
-                ).count()
-                
-                text += f"📝 {task.title}\n"
-                text += f"   ⏳ Ожидает проверки: {pending_count}\n\n"
-                
-                keyboard.append([
-                    InlineKeyboardButton(f"{task.title} ({pending_count})", callback_data=f"view_task_answers_{task.id}")
-                ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_main")])
+        # Получаем задания с ответами
+        tasks_with_answers = await repo.get_pending_answers_overview()
+        
+        if not tasks_with_answers:
+            await query.edit_message_text(
+                "📊 Ответов для проверки пока нет.",
+                reply_markup=kb.back_button("admin_main")
+            )
+            return
+        
+        text = "📊 Ответы для проверки:\n\n"
+        keyboard = []
+        
+        for task, pending_count in tasks_with_answers:
+            text += f"📝 {task.title}\n"
+            text += f"   ⏳ Ожидает проверки: {pending_count}\n\n"
             
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
+            keyboard.append([
+                InlineKeyboardButton(f"{task.title} ({pending_count})", callback_data=cd.encode("view_task_answers_{int}", task.id))
+            ])
+        
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
     async def show_admin_management(self, query):
         await query.edit_message_text(
@@ -480,27 +397,29 @@ class AdminHandlers:
         )
         return states.REMOVE_ADMIN_USERNAME
     
-    async def show_admin_list(self, query):
-        session = get_db_session()
-        try:
-            admins = session.query(User).filter(User.role == 'admin').all()
-            
-            if not admins:
-                await query.edit_message_text(
-                    "📋 Администраторов пока нет.",
-                    reply_markup=kb.back_button("admin_manage")
-                )
-                return
-            
-            text = "📋 Список администраторов:\n\n"
-            for admin in admins:
-                text += f"👤 {admin.full_name}\n"
-                text += f"   @{admin.username if admin.username else 'нет username'}\n"
-                text += f"   📅 С {admin.created_at.strftime('%d.%m.%Y')}\n\n"
-            
-            await query.edit_message_text(text, reply_markup=kb.back_button("admin_manage"))
-        finally:
-            session.close()
+    async def show_admin_list(self, query, direction='next', cursor=None):
+        page = await repo.get_admins_page(cursor=cursor, direction=direction)
+        
+        if not page.rows:
+            await query.edit_message_text(
+                "📋 Администраторов пока нет.",
+                reply_markup=kb.back_button("admin_manage")
+            )
+            return
+        
+        text = "📋 Список администраторов:\n\n"
+        for admin in page.rows:
+            text += f"👤 {admin.full_name}\n"
+            text += f"   @{admin.username if admin.username else 'нет username'}\n"
+            text += f"   📅 С {admin.created_at.strftime('%d.%m.%Y')}\n\n"
+        
+        keyboard = []
+        navigation = kb.pagination_buttons("admin_list", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_manage"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     async def start_broadcast(self, query, context):
         await query.edit_message_text(
@@ -520,32 +439,27 @@ class AdminHandlers:
                 reply_markup=kb.back_button("admin_main")
             )
         elif broadcast_type == 'project':
-            session = get_db_session()
-            try:
-                projects = session.query(Project).filter(Project.is_archived == False).all()
-                await update.callback_query.edit_message_text(
-                    "📁 Рассылка по проекту\n\n"
-                    "Выберите проект:",
-                    reply_markup=kb.projects_list_keyboard(projects, "broadcast_project")
-                )
-            finally:
-                session.close()
+            projects = await repo.get_projects(archived=False)
+            await update.callback_query.edit_message_text(
+                "📁 Рассылка по проекту\n\n"
+                "Выберите проект:",
+                reply_markup=kb.projects_list_keyboard(projects, "broadcast_project")
+            )
             return states.BROADCAST_PROJECT
         elif broadcast_type == 'user':
-            session = get_db_session()
-            try:
-                users = session.query(User).all()
-                await update.callback_query.edit_message_text(
-                    "👤 Рассылка конкретному пользователю\n\n"
-                    "Выберите пользователя:",
-                    reply_markup=kb.users_list_keyboard(users, "broadcast_user")
-                )
-            finally:
-                session.close()
+            await self.show_broadcast_users(update.callback_query)
             return states.BROADCAST_USER
         
         return states.BROADCAST_MESSAGE
     
+    async def show_broadcast_users(self, query, direction='next', cursor=None):
+        page = await repo.get_users_page(cursor=cursor, direction=direction)
+        await query.edit_message_text(
+            "👤 Рассылка конкретному пользователю\n\n"
+            "Выберите пользователя:",
+            reply_markup=kb.users_list_keyboard(page, "broadcast_user", "admin_broadcast_users")
+        )
+    
     async def handle_broadcast_project(self, update: Update, context: ContextTypes.DEFAULT_TYPE, project_id):
         context.user_data['broadcast_data']['project_id'] = project_id
         await update.callback_query.edit_message_text(
@@ -557,74 +471,47 @@ class AdminHandlers:
     
     async def handle_broadcast_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id):
         context.user_data['broadcast_data']['user_id'] = user_id
-        session = get_db_session()
-        try:
-            user = session.query(User).filter(User.id == user_id).first()
-            await update.callback_query.edit_message_text(
-                f"👤 Рассылка пользователю: {user.full_name}\n\n"
-                f"Введите сообщение для рассылки:",
-                reply_markup=kb.back_button("admin_main")
-            )
-        finally:
-            session.close()
+        user = await repo.get_user_by_id(user_id)
+        await update.callback_query.edit_message_text(
+            f"👤 Рассылка пользователю: {user.full_name}\n\n"
+            f"Введите сообщение для рассылки:",
+            reply_markup=kb.back_button("admin_main")
+        )
         return states.BROADCAST_MESSAGE
     
-    async def show_archive(self, query):
-        session = get_db_session()
-        try:
-            archived_projects = session.query(Project).filter(Project.is_archived == True).all()
-            
-            if not archived_projects:
-                await query.edit_message_text(
-                    "🗄 Архив проектов пуст.",
-                    reply_markup=kb.back_button("admin_main")
-                )
-                return
-            
-            text = "🗄 Архив проектов:\n\n"
-            keyboard = []
-            
-            for project in archived_projects:
-                participants_count = session.query(UserProject).filter(UserProject.project_id == project.id).count()
-                text += f"📂 {project.name}\n"
-                text += f"   👥 Участников: {participants_count}\n"
-                text += f"   📅 Архивирован: {project.created_at.strftime('%d.%m.%Y')}\n\n"
-                
-                keyboard.append([
-                    InlineKeyboardButton(f"📋 {project.name}", callback_data=f"project_detail_{project.id}")
-                ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_main")])
-            
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
-    
-    async def handle_confirmation(self, query, data):
-        action_parts = data.split('_')
-        action = action_parts[1]
-        
-        if action == 'archive_project':
-            project_id = int(action_parts[2])
-            await self.archive_project(query, project_id)
-        elif action == 'delete_task':
-            task_id = int(action_parts[2])
-            await self.delete_task(query, task_id)
-        elif action == 'approve_answer':
-            user_task_id = int(action_parts[2])
-            await self.approve_answer(query, user_task_id)
-        elif action == 'reject_answer':
-            user_task_id = int(action_parts[2])
-            await self.reject_answer(query, user_task_id)
+    async def show_archive(self, query, direction='next', cursor=None):
+        page = await repo.get_projects_overview(archived=True, cursor=cursor, direction=direction)
+        
+        if not page.rows:
+            await query.edit_message_text(
+                "🗄 Архив проектов пуст.",
+                reply_markup=kb.back_button("admin_main")
+            )
+            return
+        
+        text = "🗄 Архив проектов:\n\n"
+        keyboard = []
+        
+        for project, participants_count, _, _ in page.rows:
+            text += f"📂 {project.name}\n"
+            text += f"   👥 Участников: {participants_count}\n"
+            text += f"   📅 Архивирован: {project.created_at.strftime('%d.%m.%Y')}\n\n"
+            
+            keyboard.append([
+                InlineKeyboardButton(f"📋 {project.name}", callback_data=cd.encode("project_detail_{int}", project.id))
+            ])
+        
+        navigation = kb.pagination_buttons("admin_archive", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     async def archive_project(self, query, project_id):
-        session = get_db_session()
         try:
-            project = session.query(Project).filter(Project.id == project_id).first()
+            project = await repo.archive_project(project_id)
             if project:
-                project.is_archived = True
-                session.commit()
-                
                 await query.edit_message_text(
                     f"✅ Проект '{project.name}' перемещен в архив!",
                     reply_markup=kb.back_button("admin_projects")
@@ -634,44 +521,22 @@ class AdminHandlers:
         except Exception as e:
             logger.error(f"Error archiving project: {e}")
             await query.edit_message_text("❌ Ошибка при архивации проекта")
-        finally:
-            session.close()
     
     async def confirm_archive_project(self, query, project_id):
-        session = get_db_session()
-        try:
-            project = session.query(Project).filter(Project.id == project_id).first()
-            if project:
-                await query.edit_message_text(
-                    f"🗄 Архивирование проекта\n\n"
-                    f"Вы уверены, что хотите архивировать проект '{project.name}'?\n\n"
-                    f"⚠️ Все задания проекта станут неактивными.",
-                    reply_markup=kb.confirmation_buttons("archive_project", project_id)
-                )
-        finally:
-            session.close()
+        project = await repo.get_project(project_id)
+        if project:
+            await query.edit_message_text(
+                f"🗄 Архивирование проекта\n\n"
+                f"Вы уверены, что хотите архивировать проект '{project.name}'?\n\n"
+                f"⚠️ Все задания проекта станут неактивными.",
+                reply_markup=kb.confirmation_buttons("archive_project", project_id)
+            )
     
     async def approve_answer(self, query, user_task_id):
-        session = get_db_session()
         try:
-            user_task = session.query(UserTask).filter(UserTask.id == user_task_id).first()
-            if user_task:
-                user_task.status = 'approved'
-                user_task.reviewed_at = datetime.now()
-                session.commit()
-                
-                # Уведомляем пользователя
-                user = session.query(User).filter(User.id == user_task.user_id).first()
-                task = session.query(Task).filter(Task.id == user_task.task_id).first()
-                
-                try:
-                    await self.application.bot.send_message(
-                        chat_id=user.user_id,
-                        text=f"🎉 Ваш ответ на задание '{task.title}' был утвержден!"
-                    )
-                except Exception as e:
-                    logger.error(f"Error notifying user about approval: {e}")
-                
+            # Уведомление пользователю ставится в очередь вместе с изменением статуса
+            reviewed = await repo.review_answer(user_task_id, 'approved')
+            if reviewed:
                 await query.edit_message_text(
                     "✅ Ответ утвержден! Пользователь уведомлен.",
                     reply_markup=kb.back_button("admin_view_answers")
@@ -681,31 +546,12 @@ class AdminHandlers:
         except Exception as e:
             logger.error(f"Error approving answer: {e}")
             await query.edit_message_text("❌ Ошибка при утверждении ответа")
-        finally:
-            session.close()
     
     async def reject_answer(self, query, user_task_id):
-        session = get_db_session()
         try:
-            user_task = session.query(UserTask).filter(UserTask.id == user_task_id).first()
-            if user_task:
-                user_task.status = 'rejected'
-                user_task.reviewed_at = datetime.now()
-                session.commit()
-                
-                # Уведомляем пользователя
-                user = session.query(User).filter(User.id == user_task.user_id).first()
-                task = session.query(Task).filter(Task.id == user_task.task_id).first()
-                
-                try:
-                    await self.application.bot.send_message(
-                        chat_id=user.user_id,
-                        text=f"❌ Ваш ответ на задание '{task.title}' был отклонен.\n\n"
-                             "Пожалуйста, пересмотрите задание и отправьте ответ заново."
-                    )
-                except Exception as e:
-                    logger.error(f"Error notifying user about rejection: {e}")
-                
+            # Уведомление пользователю ставится в очередь вместе с изменением статуса
+            reviewed = await repo.review_answer(user_task_id, 'rejected')
+            if reviewed:
                 await query.edit_message_text(
                     "❌ Ответ отклонен! Пользователь уведомлен.",
                     reply_markup=kb.back_button("admin_view_answers")
@@ -714,6 +560,4 @@ class AdminHandlers:
                 await query.edit_message_text("❌ Ответ не найден")
         except Exception as e:
             logger.error(f"Error rejecting answer: {e}")
-            await query.edit_message_text("❌ Ошибка при отклонении ответа")
-        finally:
-            session.close()
\ No newline at end of file
+            await query.edit_message_text("❌ Ошибка при отклонении ответа")
\ No newline at end of file
@@ -1,15 +1,28 @@
+import time
+# Отсчет холодного старта: импорты, проверка схемы, сборка приложения
+STARTED_AT = time.perf_counter()
 import os
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
-    MessageHandler, filters, ContextTypes, ConversationHandler
+    MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
 )
-from database import get_db_session, User
+import database
+import repository as repo
 import keyboards as kb
+import callback_codec as cd
 import states
-import utils
 import config
+from delivery import DeliveryEngine
+from outbox import OutboxWorker
+from reminders import DeadlineReminders
+from digests import AdminDigests
+from persistence import SQLPersistence
+from processing import build_update_processing
+import metrics
+from middleware import resolve_user, current_user
 from admin_handlers import AdminHandlers
 from message_handlers import MessageHandlers
 from callback_handlers import CallbackHandlers
@@ -20,31 +33,76 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+IMPORT_SECONDS = time.perf_counter() - STARTED_AT
 
 class BotPractice:
-    def __init__(self):
-        self.application = Application.builder().token(config.BOT_TOKEN).build()
+    def __init__(self, request=None):
+        # Апдейты разных пользователей обрабатываются параллельно, одного - по порядку
+        update_queue, update_processor = build_update_processing()
+        builder = (
+            Application.builder()
+            .token(config.BOT_TOKEN)
+            .request(request or metrics.InstrumentedRequest(connection_pool_size=256))
+            .update_queue(update_queue)
+            .concurrent_updates(update_processor)
+            .persistence(SQLPersistence())
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+        )
+        if config.BOT_API_URL:
+            # Свой сервер Bot API (например, local_bot_api.py для нагрузочных тестов)
+            builder.base_url(f"{config.BOT_API_URL}/bot").base_file_url(f"{config.BOT_API_URL}/file/bot")
+        self.application = builder.build()
+        self.delivery = DeliveryEngine(self.application.bot)
+        self.outbox = OutboxWorker(self.application.bot, self.delivery)
+        self.reminders = DeadlineReminders()
+        self.digests = AdminDigests()
         self.admin_handlers = AdminHandlers(self.application)
-        self.message_handlers = MessageHandlers(self.application)
+        self.message_handlers = MessageHandlers(self.application, self.delivery)
         self.callback_handlers = CallbackHandlers(self.application)
         
         self.setup_handlers()
+        self.reminders.schedule(self.application.job_queue)
+        self.digests.schedule(self.application.job_queue)
+        
+        # Метрики для /metrics
+        metrics.instrument_handlers(self.application)
+        metrics.register_application(self.application, update_queue)
+    
+    async def post_init(self, application):
+        # Фоновая доставка уведомлений из outbox
+        self.outbox.start()
+        
+        initialized = time.perf_counter() - STARTED_AT
+        metrics.STARTUP_SECONDS.labels('initialized').set(initialized)
+        logger.info(f"Bot initialized {initialized * 1000:.0f} ms after start")
+    
+    async def post_stop(self, application):
+        # До shutdown: HTTP-клиент бота еще открыт, и текущая пачка outbox доотправится
+        await self.outbox.stop()
     
     def setup_handlers(self):
+        # Пользователь апдейта находится один раз до всех обработчиков
+        self.application.add_handler(TypeHandler(Update, resolve_user), group=-1)
+        
         # Команды
         self.application.add_handler(CommandHandler("start", self.start))
-        self.application.add_handler(CommandHandler("admin", self.admin_login))
         self.application.add_handler(CommandHandler("cancel", self.cancel))
         
-        # ConversationHandler для админ-панели
+        # Кнопка сводки для админов открывает панель из любого состояния, даже без /admin
+        view_answers = CallbackQueryHandler(
+            self.admin_handlers.open_view_answers, pattern=cd.route_filter("admin_view_answers")
+        )
+        
+        # ConversationHandler для админ-панели (/admin - его точка входа)
         admin_conv = ConversationHandler(
-            entry_points=[CommandHandler("admin", self.admin_login)],
+            entry_points=[CommandHandler("admin", self.admin_login), view_answers],
             states={
                 states.ADMIN_PASSWORD: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_admin_password)
                 ],
                 states.ADMIN_MENU: [
-                    CallbackQueryHandler(self.admin_handlers.handle_admin_callback, pattern="^admin_")
+                    CallbackQueryHandler(self.admin_handlers.handle_admin_callback, pattern=self.admin_handlers.router.handles)
                 ],
                 
                 # Создание проекта
@@ -60,7 +118,7 @@ class BotPractice:
                 
                 # Создание задания
                 states.CREATE_TASK_PROJECT: [
-                    CallbackQueryHandler(self.handle_task_project_selection, pattern="^select_project_task_")
+                    CallbackQueryHandler(self.handle_task_project_selection, pattern=cd.route_filter("select_project_task_{int}"))
                 ],
                 states.CREATE_TASK_TITLE: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.admin_handlers.handle_create_task_title)
@@ -91,23 +149,19 @@ class BotPractice:
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.message_handlers.handle_broadcast_message)
                 ],
             },
-            fallbacks=[CommandHandler("cancel", self.cancel)],
+            fallbacks=[CommandHandler("cancel", self.cancel), view_answers],
+            name="admin_conv",
+            persistent=True,
             map_to_parent={
                 ConversationHandler.END: ConversationHandler.END,
             }
         )
         self.application.add_handler(admin_conv)
         
-        # Обработчики callback'ов для пользователей
+        # Обработчики callback'ов для пользователей (префиксы берутся из таблицы маршрутов)
         self.application.add_handler(CallbackQueryHandler(
             self.callback_handlers.handle_callback, 
-            pattern="^(my_|project_|task_|answer_|clarify_|view_|edit_)"
-        ))
-        
-        # Общие обработчики callback'ов
-        self.application.add_handler(CallbackQueryHandler(
-            self.callback_handlers.handle_callback,
-            pattern="^(confirm_|cancel_)"
+            pattern=self.callback_handlers.router.handles
         ))
         
         # Обработчики сообщений
@@ -134,9 +188,12 @@ class BotPractice:
         }
         
         # Регистрация/обновление пользователя
-        existing_user = utils.get_user_by_telegram_id(user.id)
+        existing_user = await current_user(update, context)
         if not existing_user:
-            utils.create_user(user_data)
+            try:
+                await repo.create_user(user_data)
+            except Exception as e:
+                logger.error(f"Error creating user: {e}")
             welcome_text = (
                 "👋 Добро пожаловать в B&DPracticeKUB!\n\n"
                 "🚀 Бизнес-практика проще, чем кажется!\n\n"
@@ -148,7 +205,7 @@ class BotPractice:
         await update.message.reply_text(welcome_text, reply_markup=kb.user_main_menu())
     
     async def admin_login(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user = utils.get_user_by_telegram_id(update.effective_user.id)
+        user = await current_user(update, context)
         if user and user.role == 'admin':
             await update.message.reply_text(
                 "✅ Вы уже администратор!",
@@ -161,23 +218,12 @@ class BotPractice:
     
     async def handle_admin_password(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.message.text == config.ADMIN_PASSWORD:
-            user = utils.get_user_by_telegram_id(update.effective_user.id)
-            session = get_db_session()
             try:
-                if user:
-                    user.role = 'admin'
-                else:
-                    # Создаем пользователя как админа
-                    user_data = {
-                        'user_id': update.effective_user.id,
-                        'username': update.effective_user.username,
-                        'full_name': update.effective_user.full_name,
-                        'role': 'admin'
-                    }
-                    user = User(**user_data)
-                    session.add(user)
-                
-                session.commit()
+                await repo.grant_admin({
+                    'user_id': update.effective_user.id,
+                    'username': update.effective_user.username,
+                    'full_name': update.effective_user.full_name
+                })
                 
                 await update.message.reply_text(
                     "✅ Успешный вход в админ-панель!",
@@ -185,12 +231,9 @@ class BotPractice:
                 )
                 return states.ADMIN_MENU
             except Exception as e:
-                session.rollback()
                 logger.error(f"Error in admin login: {e}")
                 await update.message.reply_text("❌ Ошибка при входе в админ-панель")
                 return ConversationHandler.END
-            finally:
-                session.close()
         else:
             await update.message.reply_text("❌ Неверный пароль. Попробуйте снова или используйте /start")
             return ConversationHandler.END
@@ -199,11 +242,11 @@ class BotPractice:
         query = update.callback_query
         await query.answer()
         
-        project_id = int(query.data.split('_')[-1])
+        project_id, = cd.route_args(query.data, "select_project_task_{int}")
         return await self.admin_handlers.handle_create_task_project(update, context, project_id)
     
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        user = utils.get_user_by_telegram_id(update.effective_user.id)
+        user = await current_user(update, context)
         
         # Очищаем состояние
         context.user_data.clear()
@@ -227,29 +270,41 @@ class BotPractice:
             "Используйте кнопки меню для навигации."
         )
 
+def prepare_database():
+    """Проверяет схему БД по настройке SCHEMA_CHECK; возвращает True, если проверка выполнялась"""
+    if config.SCHEMA_CHECK == 'never':
+        return False
+    return database.prepare_schema(force=config.SCHEMA_CHECK == 'always')
+
 def main():
+    metrics.STARTUP_SECONDS.labels('imports').set(IMPORT_SECONDS)
+    
+    # Схема БД проверяется только при смене ее версии (SCHEMA_CHECK=always - каждый раз)
+    started = time.perf_counter()
+    checked = prepare_database()
+    schema_seconds = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.labels('schema').set(schema_seconds)
+    
     # Создаем бота
+    started = time.perf_counter()
     bot_practice = BotPractice()
-    
-    # Запускаем систему пингов (если есть WEBHOOK_URL)
-    webhook_url = os.environ.get('WEBHOOK_URL', '')
-    if webhook_url:
-        utils.keep_alive(webhook_url)
-        logger.info("Keep-alive system started")
+    setup_seconds = time.perf_counter() - started
+    metrics.STARTUP_SECONDS.labels('setup').set(setup_seconds)
+    logger.info(
+        f"Startup: imports {IMPORT_SECONDS * 1000:.0f} ms, "
+        f"schema {schema_seconds * 1000:.0f} ms ({'checked' if checked else 'up to date'}), "
+        f"setup {setup_seconds * 1000:.0f} ms"
+    )
     
     # Запускаем бота
+    webhook_url = os.environ.get('WEBHOOK_URL', '')
     port = int(os.environ.get('PORT', 8443))
     
     if webhook_url:
-        # Для production (Render.com)
-        bot_practice.application.run_webhook(
-            listen="0.0.0.0",
-            port=port,
-            url_path=config.BOT_TOKEN,
-            webhook_url=f"{webhook_url}/{config.BOT_TOKEN}",
-            drop_pending_updates=True
-        )
-        logger.info("Bot running in webhook mode")
+        # Для production (Render.com): webhook, /healthz и /metrics на одном порту.
+        # tornado нужен только здесь - в режиме polling его не импортируем
+        from webserver import serve_webhook
+        asyncio.run(serve_webhook(bot_practice.application, webhook_url, port))
     else:
         # Для локальной разработки
         bot_practice.application.run_polling(drop_pending_updates=True)
@@ -0,0 +1,408 @@
+"""Офлайн-нагрузочный прогон основных сценариев бота.
+
+Настоящие обработчики BotPractice получают синтетические апдейты; Bot API
+подменен локальными ответами (FakeRequest) или сервером local_bot_api.py
+(--bot-api), база - временный SQLite заданного размера. Для каждого сценария
+печатаются пропускная способность, p50/p95/p99 и число SQL-запросов на апдейт.
+
+    python benchmark.py --users 5000 --requests 500 --clients 16
+    python benchmark.py --bot-api http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from telegram import Update
+from telegram.request import BaseRequest
+
+# Текущий замер апдейта: SQL-запросы считаются в него (контекст доходит и до потоков БД)
+current_sample = contextvars.ContextVar('current_sample', default=None)
+
+class Sample:
+    __slots__ = ('seconds', 'queries')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.queries = 0
+
+def _count_query(statement, parameters, seconds):
+    sample = current_sample.get()
+    if sample is not None:
+        sample.queries += 1
+
+class FakeRequest(BaseRequest):
+    """Отвечает на вызовы Bot API локально, с необязательной задержкой"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {}
+        self.message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params):
+        self.message_id += 1
+        chat_id = int(params.get('chat_id') or 0)
+        return {
+            'message_id': params.get('message_id') or self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = request_data.parameters if request_data else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if api_method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                      'can_join_groups': False, 'can_read_all_group_messages': False,
+                      'supports_inline_queries': False}
+        elif api_method in ('sendMessage', 'sendPhoto', 'editMessageText', 'editMessageReplyMarkup'):
+            result = self._message(params)
+        elif api_method == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+class Updates:
+    """Синтетические апдейты в формате Bot API"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.update_id = 0
+
+    def _user(self, telegram_id):
+        return {'id': telegram_id, 'is_bot': False, 'first_name': f'Bench{telegram_id}',
+                'username': f'bench{telegram_id}'}
+
+    def _chat_message(self, telegram_id, text):
+        self.update_id += 1
+        message = {
+            'message_id': self.update_id,
+            'date': int(time.time()),
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': self._user(telegram_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    def message(self, telegram_id, text):
+        return Update.de_json({'update_id': self.update_id + 1,
+                               'message': self._chat_message(telegram_id, text)}, self.bot)
+
+    def callback(self, telegram_id, data):
+        message = self._chat_message(telegram_id, 'menu')
+        return Update.de_json({
+            'update_id': self.update_id,
+            'callback_query': {
+                'id': str(self.update_id),
+                'from': self._user(telegram_id),
+                'chat_instance': str(telegram_id),
+                'data': data,
+                'message': message,
+            },
+        }, self.bot)
+
+def seed(users, projects, tasks_per_project):
+    """Заполняет базу: админ, пользователи по проектам, задания и ответы на проверке"""
+    from database import get_db_session, User, Project, UserProject, Task, TaskAssignment, UserTask
+    session = get_db_session()
+    try:
+        admin = User(user_id=1, username='admin', full_name='Admin', role='admin')
+        session.add(admin)
+        members = [User(user_id=1000 + i, username=f'user{i}', full_name=f'User {i}') for i in range(users)]
+        session.add_all(members)
+        session.flush()
+
+        project_rows = [Project(name=f'Project {i}', description='benchmark', created_by=admin.id)
+                        for i in range(projects)]
+        session.add_all(project_rows)
+        session.flush()
+
+        by_project = {project.id: [] for project in project_rows}
+        for i, user in enumerate(members):
+            project = project_rows[i % projects]
+            by_project[project.id].append(user)
+            session.add(UserProject(user_id=user.id, project_id=project.id))
+
+        # Задание 0 каждого проекта уже отвечено (ответы ждут проверки), остальные открыты
+        answered, open_tasks = {}, {}
+        deadline = datetime.now() + timedelta(days=7)
+        for project in project_rows:
+            member_ids = [user.id for user in by_project[project.id]]
+            rows = [Task(project_id=project.id, title=f'Task {i}', description='benchmark',
+                         created_by=admin.id, deadline=deadline)
+                    for i in range(tasks_per_project)]
+            session.add_all(rows)
+            session.flush()
+            session.add_all(TaskAssignment(task_id=task.id, user_id=user_id) for task in rows for user_id in member_ids)
+            answered[project.id] = rows[0]
+            open_tasks[project.id] = rows[1:]
+
+        pending = []
+        for project in project_rows:
+            for user in by_project[project.id]:
+                user_task = UserTask(user_id=user.id, task_id=answered[project.id].id,
+                                     answer_text='benchmark answer', status='pending')
+                session.add(user_task)
+                pending.append(user_task)
+        session.commit()
+
+        # Для сценария ответа: (telegram id, id открытого задания его проекта)
+        answerable = [
+            (user.user_id, open_tasks[project_id][0].id)
+            for project_id, project_users in by_project.items() if open_tasks[project_id]
+            for user in project_users
+        ]
+        return {
+            'members': [user.user_id for user in members],
+            'pending': [user_task.id for user_task in pending],
+            'answerable': answerable,
+        }
+    finally:
+        session.close()
+
+def percentile(values, q):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+class Benchmark:
+    def __init__(self, bot_practice, clients):
+        self.bot_practice = bot_practice
+        self.application = bot_practice.application
+        self.clients = clients
+        self.results = []
+
+    async def _process(self, update, sample=None):
+        current_sample.set(sample)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(
+            update, self.application.process_update(update)
+        )
+        if sample is not None:
+            sample.seconds = time.perf_counter() - started
+
+    async def _drain_background(self):
+        """Ждет фоновые рассылки, запущенные обработчиками"""
+        tasks = list(self.bot_practice.delivery.background_tasks)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run_flow(self, name, updates, prepare=()):
+        # Подготовительные апдейты (вход в диалог и т.п.) не замеряются
+        for update in prepare:
+            await self._process(update)
+        await self._drain_background()
+
+        pending = list(updates)
+        samples = []
+
+        async def client():
+            while pending:
+                sample = Sample()
+                samples.append(sample)
+                await self._process(pending.pop(), sample)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(self.clients)))
+        await self._drain_background()
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(sample.seconds * 1000 for sample in samples)
+        result = {
+            'flow': name,
+            'updates': len(samples),
+            'seconds': elapsed,
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'queries_per_update': sum(sample.queries for sample in samples) / len(samples),
+        }
+        self.results.append(result)
+        return result
+
+async def check_unit_of_work(writers):
+    """Блок unit_of_work после первого flush держит блокировку записи SQLite. Писатели, заняв
+    все потоки БД, ждут эту блокировку - блок должен закончиться, не дожидаясь их busy_timeout.
+    Возвращает (секунды, ошибки писателей)"""
+    import repository as repo
+    from database import unit_of_work
+
+    locked = asyncio.Event()
+    errors = []
+
+    async def writer():
+        await locked.wait()
+        try:
+            await repo.log_admin_action(1, 'benchmark', 0, 'concurrent write')
+        except Exception as e:
+            errors.append(e)
+
+    # Писатели создаются вне блока, иначе их run_db попадут в его транзакцию
+    tasks = [asyncio.create_task(writer()) for _ in range(writers)]
+    started = time.perf_counter()
+    async with unit_of_work():
+        await repo.log_admin_action(1, 'benchmark', 0, 'unit of work step 1')
+        locked.set()
+        # Даем писателям занять потоки и встать в ожидание блокировки
+        await asyncio.sleep(0.2)
+        await repo.log_admin_action(1, 'benchmark', 0, 'unit of work step 2')
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - started, errors
+
+async def run(args):
+    # Модули бота читают настройки при импорте, поэтому импортируем после настройки окружения
+    import callback_codec as cd
+    import config
+    import database
+    import metrics
+    from app import BotPractice
+
+    database.query_listeners.append(_count_query)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    database.prepare_schema()
+    print(f"Seeding {args.users} users, {args.projects} projects, {args.tasks} tasks per project...")
+    data = seed(args.users, args.projects, args.tasks)
+
+    # С --bot-api запросы идут по HTTP в local_bot_api.py, иначе отвечаем в памяти
+    request = None if args.bot_api else FakeRequest(latency=args.api_latency / 1000)
+    bot_practice = BotPractice(request=request)
+
+    def sent_messages():
+        if request is not None:
+            return request.calls.get('sendMessage', 0)
+        return metrics.registry.get_sample_value(
+            'bot_api_requests_total', {'method': 'sendMessage', 'status': '200'}
+        ) or 0
+    application = bot_practice.application
+    make = Updates(application.bot)
+    bench = Benchmark(bot_practice, args.clients)
+    count = min(args.requests, len(data['members']))
+    admin_id = 1
+
+    await application.initialize()
+    try:
+        # /start новых пользователей - регистрация
+        new_ids = range(10 ** 6, 10 ** 6 + args.requests)
+        await bench.run_flow('start', [make.message(user_id, '/start') for user_id in new_ids])
+
+        # "Мои задания"
+        members = data['members'][:count]
+        await bench.run_flow('my_tasks', [make.callback(user_id, cd.encode('my_tasks')) for user_id in members])
+
+        # Ответ на задание: кнопка "Ответить", затем текст ответа (замеряется текст)
+        answerable = data['answerable'][:count]
+        await bench.run_flow(
+            'answer_submit',
+            [make.message(user_id, 'benchmark answer text') for user_id, _ in answerable],
+            prepare=[make.callback(user_id, cd.encode('answer_task_{int}', task_id)) for user_id, task_id in answerable]
+        )
+
+        # Проверка ответов админом
+        await bench.run_flow(
+            'admin_review',
+            [make.callback(admin_id, cd.encode('confirm_approve_answer_{int}', user_task_id))
+             for user_task_id in data['pending'][:count]],
+            prepare=[make.message(admin_id, '/admin')]
+        )
+
+        if args.bot_api:
+            # После проверки ответов чат админа под лимитом - ждем, иначе ответ о запуске рассылки получит 429
+            await asyncio.sleep(2)
+
+        # Рассылка всем пользователям: время включает доставку всех сообщений
+        admin_data = application.user_data[admin_id]
+        admin_data['state'] = 'waiting_broadcast_message'
+        admin_data['broadcast_data'] = {'type': 'all'}
+        sends_before = sent_messages()
+        result = await bench.run_flow('broadcast', [make.message(admin_id, 'benchmark broadcast')])
+        result['messages_sent'] = int(sent_messages() - sends_before)
+
+        contention_seconds, contention_errors = await check_unit_of_work(config.DB_WORKERS)
+    finally:
+        await application.shutdown()
+
+    print()
+    print(f"{'flow':<15}{'updates':>9}{'upd/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}")
+    for result in bench.results:
+        print(
+            f"{result['flow']:<15}{result['updates']:>9}{result['throughput']:>10.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+            f"{result['queries_per_update']:>10.1f}"
+        )
+    broadcast = bench.results[-1]
+    print(f"\nbroadcast: {broadcast['messages_sent']} messages in {broadcast['seconds']:.2f} s")
+    if request is not None:
+        print(f"Bot API calls: {json.dumps(request.calls, sort_keys=True)}")
+    print(f"unit_of_work under contention: {contention_seconds:.2f} s, "
+          f"{len(contention_errors)} of {config.DB_WORKERS} concurrent writes failed")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(bench.results, f, indent=2)
+
+    if contention_errors:
+        raise SystemExit(f"unit_of_work blocked concurrent writers: {contention_errors[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк сценариев бота")
+    parser.add_argument('--users', type=int, default=1000, help="пользователей в базе")
+    parser.add_argument('--projects', type=int, default=10, help="проектов в базе")
+    parser.add_argument('--tasks', type=int, default=5, help="заданий на проект (минимум 2)")
+    parser.add_argument('--requests', type=int, default=200, help="апдейтов на сценарий")
+    parser.add_argument('--clients', type=int, default=8, help="одновременных клиентов")
+    parser.add_argument('--api-latency', type=float, default=0, help="задержка ответа Bot API, мс")
+    parser.add_argument('--send-rate', type=float, help="лимит рассылки, сообщений/с (без --bot-api - 1000)")
+    parser.add_argument('--bot-api', help="адрес local_bot_api.py вместо ответов в памяти")
+    parser.add_argument('--database', help="файл SQLite (по умолчанию временный)")
+    parser.add_argument('--json', help="сохранить результаты в файл")
+    parser.add_argument('--verbose', action='store_true', help="показывать логи бота")
+    args = parser.parse_args()
+    if args.tasks < 2:
+        parser.error("--tasks должно быть не меньше 2")
+
+    if args.database and os.path.exists(args.database):
+        parser.error(f"{args.database} уже существует - бенчмарк заполняет пустую базу")
+    if args.bot_api:
+        os.environ['BOT_API_URL'] = args.bot_api
+    # В памяти лимитов Telegram нет; с local_bot_api.py по умолчанию оставляем боевые
+    send_rate = args.send_rate or (None if args.bot_api else 1000)
+    if send_rate:
+        os.environ['SEND_GLOBAL_RATE'] = str(send_rate)
+        os.environ['SEND_CHAT_RATE'] = str(send_rate)
+    # Журнал медленных запросов не нужен - запросы считаются сами
+    os.environ.setdefault('SLOW_QUERY_MS', '10000')
+    # Метрики включены, как в production (webhook): их цена входит в замер
+    os.environ.setdefault('METRICS_ENABLED', '1')
+
+    with tempfile.TemporaryDirectory(prefix='bot-bench-') as directory:
+        path = args.database or os.path.join(directory, 'bench.db')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+        asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
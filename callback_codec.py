@@ -0,0 +1,154 @@
+import base64
+import functools
+import itertools
+import zlib
+from collections import OrderedDict
+import config
+
+# Компактная callback_data: '~' + base64(код маршрута, 2 байта + аргументы varint).
+# Код - crc32 шаблона маршрута, поэтому кнопки переживают перезапуск и деплой.
+# Если строка все равно длиннее лимита Telegram, аргументы уходят в память
+# процесса, а в кнопку пишется '#' + base64(номер записи).
+ENCODED_PREFIX = '~'
+STORED_PREFIX = '#'
+MAX_CALLBACK_DATA = 64
+DIRECTIONS = ('next', 'prev')
+
+# Код маршрута -> шаблон; заполняется при регистрации маршрутов и кодировании
+_patterns = {}
+_payloads = OrderedDict()
+_payload_ids = itertools.count(1)
+
+@functools.lru_cache(maxsize=None)
+def _parse_pattern(pattern):
+    """Шаблон -> (код, типы аргументов)"""
+    types = tuple(
+        segment[1:-1] for segment in pattern.split('_')
+        if segment.startswith('{') and segment.endswith('}')
+    )
+    return zlib.crc32(pattern.encode()) & 0xFFFF, types
+
+def register(pattern):
+    code, _ = _parse_pattern(pattern)
+    known = _patterns.setdefault(code, pattern)
+    if known != pattern:
+        raise ValueError(f"Callback route code collision: {known} / {pattern}")
+    return code
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError(f"Negative callback argument: {value}")
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(raw, pos):
+    value = shift = 0
+    while True:
+        byte = raw[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def encode(pattern, *args):
+    """callback_data для маршрута: encode('task_detail_{int}', task_id)"""
+    code = register(pattern)
+    _, types = _parse_pattern(pattern)
+    if len(args) != len(types):
+        raise ValueError(f"{pattern} expects {len(types)} arguments, got {len(args)}")
+
+    out = bytearray(code.to_bytes(2, 'big'))
+    for kind, value in zip(types, args):
+        if kind == 'int':
+            _write_varint(out, value)
+        elif kind == 'dir':
+            _write_varint(out, DIRECTIONS.index(value))
+        else:
+            value = str(value).encode()
+            _write_varint(out, len(value))
+            out += value
+
+    data = ENCODED_PREFIX + _b64encode(bytes(out))
+    if len(data) <= MAX_CALLBACK_DATA:
+        return data
+    return _store(pattern, args)
+
+def _store(pattern, args):
+    payload_id = next(_payload_ids)
+    _payloads[payload_id] = (pattern, tuple(args))
+    if len(_payloads) > config.CALLBACK_STORE_SIZE:
+        _payloads.popitem(last=False)
+    out = bytearray()
+    _write_varint(out, payload_id)
+    return STORED_PREFIX + _b64encode(bytes(out))
+
+def is_encoded(data):
+    return data[:1] in (ENCODED_PREFIX, STORED_PREFIX)
+
+def decode(data):
+    """(шаблон, аргументы) для компактной callback_data; None, если не разобрать"""
+    try:
+        raw = _b64decode(data[1:])
+        if data[0] == STORED_PREFIX:
+            payload_id, _ = _read_varint(raw, 0)
+            payload = _payloads.get(payload_id)
+            if payload is None:
+                return None
+            _payloads.move_to_end(payload_id)
+            return payload[0], list(payload[1])
+
+        pattern = _patterns.get(int.from_bytes(raw[:2], 'big'))
+        if pattern is None:
+            return None
+        _, types = _parse_pattern(pattern)
+        args = []
+        pos = 2
+        for kind in types:
+            value, pos = _read_varint(raw, pos)
+            if kind == 'dir':
+                value = DIRECTIONS[value]
+            elif kind == 'str':
+                value, pos = raw[pos:pos + value].decode(), pos + value
+            args.append(value)
+        if pos != len(raw):
+            return None
+        return pattern, args
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return None
+
+def route_filter(pattern):
+    """Фильтр для CallbackQueryHandler(pattern=...) по одному маршруту"""
+    register(pattern)
+    prefix = pattern.split('{', 1)[0]
+
+    def matches(data):
+        if isinstance(data, str) and is_encoded(data):
+            decoded = decode(data)
+            return decoded is not None and decoded[0] == pattern
+        return isinstance(data, str) and data.startswith(prefix)
+    return matches
+
+def route_args(data, pattern):
+    """Аргументы маршрута из компактной или старой строковой callback_data"""
+    if is_encoded(data):
+        decoded = decode(data)
+        return decoded[1] if decoded and decoded[0] == pattern else None
+    # Старые кнопки в уже отправленных сообщениях: 'prefix_1_2'
+    prefix = pattern.split('{', 1)[0]
+    _, types = _parse_pattern(pattern)
+    parts = data[len(prefix):].split('_')
+    if not data.startswith(prefix) or len(parts) != len(types):
+        return None
+    try:
+        return [int(part) if kind == 'int' else part for kind, part in zip(types, parts)]
+    except ValueError:
+        return None
@@ -1,10 +1,13 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import get_db_session, User, Project, Task, UserTask, UserProject
+import repository as repo
 import keyboards as kb
+import callback_codec as cd
 import states
 import utils
+from router import CallbackRouter
+from middleware import current_user
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -12,174 +15,138 @@ logger = logging.getLogger(__name__)
 class CallbackHandlers:
     def __init__(self, application):
         self.application = application
+        self.router = self.setup_routes()
+    
+    def setup_routes(self):
+        """Таблица пользовательских callback'ов: обработчик получает (query, context, user, *аргументы)"""
+        router = CallbackRouter('user')
+        
+        # Пользовательское меню
+        router.add("my_tasks", lambda query, context, user: self.show_user_tasks(query, user))
+        router.add("my_tasks_{dir}_{int}", lambda query, context, user, direction, cursor: self.show_user_tasks(query, user, direction, cursor))
+        router.add("my_answers", lambda query, context, user: self.show_user_answers(query, user))
+        router.add("my_answers_{dir}_{int}", lambda query, context, user, direction, cursor: self.show_user_answers(query, user, direction, cursor))
+        router.add("my_profile", lambda query, context, user: self.show_user_profile(query, user))
+        router.add("common_board", lambda query, context, user: self.show_common_board(query))
+        router.add("common_board_{dir}_{int}", lambda query, context, user, direction, cursor: self.show_common_board(query, direction, cursor))
+        router.add("edit_name", lambda query, context, user: self.start_edit_name(query, context))
+        router.add("edit_status", lambda query, context, user: self.start_edit_status(query, context))
+        
+        # Задания и ответы
+        router.add("task_detail_{int}", lambda query, context, user, task_id: self.show_task_detail(query, task_id, user))
+        router.add("answer_task_{int}", lambda query, context, user, task_id: self.start_task_answer(query, context, task_id))
+        router.add("clarify_task_{int}", lambda query, context, user, task_id: self.start_clarify_task(query, context, task_id))
+        router.add("view_my_answer_{int}", lambda query, context, user, user_task_id: self.show_my_answer_detail(query, user_task_id))
+        return router
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()
         
-        data = query.data
-        user = utils.get_user_by_telegram_id(query.from_user.id)
+        user = await current_user(update, context)
         
         if not user:
             await query.edit_message_text("❌ Пользователь не найден")
             return
         
-        # Определяем тип callback и перенаправляем обработку
-        if data.startswith('admin_'):
-            await self.handle_admin_callback(query, context, data, user)
-        elif data.startswith('project_'):
-            await self.handle_project_callback(query, context, data, user)
-        elif data.startswith('task_'):
-            await self.handle_task_callback(query, context, data, user)
-        elif data.startswith('user_'):
-            await self.handle_user_callback(query, context, data, user)
-        elif data.startswith('confirm_'):
-            await self.handle_confirmation(query, context, data, user)
-        elif data.startswith('answer_'):
-            await self.handle_answer_callback(query, context, data, user)
-        elif data.startswith('my_'):
-            await self.handle_my_callback(query, context, data, user)
-        else:
+        found, _ = await self.router.dispatch(query.data, query, context, user)
+        if not found:
             await query.edit_message_text("❌ Неизвестная команда")
     
-    async def handle_my_callback(self, query, context, data, user):
-        """Обработка callback'ов пользовательского меню"""
-        if data == "my_tasks":
-            await self.show_user_tasks(query, user)
-        elif data == "my_answers":
-            await self.show_user_answers(query, user)
-        elif data == "my_profile":
-            await self.show_user_profile(query, user)
-        elif data == "common_board":
-            await self.show_common_board(query)
-        elif data == "edit_name":
-            await self.start_edit_name(query, context)
-        elif data == "edit_status":
-            await self.start_edit_status(query, context)
-    
-    async def show_user_tasks(self, query, user):
-        session = get_db_session()
-        try:
-            # Получаем проекты пользователя
-            user_projects = session.query(UserProject).filter(UserProject.user_id == user.id).all()
-            if not user_projects:
-                await query.edit_message_text(
-                    "📋 У вас пока нет заданий.\n\n"
-                    "Вы не участвуете в проектах или для вас еще не создали задания.",
-                    reply_markup=kb.back_button("user_main")
-                )
-                return
-            
-            project_ids = [up.project_id for up in user_projects]
+    async def show_user_tasks(self, query, user, direction='next', cursor=None):
+        # Получаем одну страницу заданий из проектов пользователя
+        page = await repo.get_user_tasks_overview(user.id, cursor=cursor, direction=direction)
+        if page is None:
+            await query.edit_message_text(
+                "📋 У вас пока нет заданий.\n\n"
+                "Вы не участвуете в проектах или для вас еще не создали задания.",
+                reply_markup=kb.back_button("user_main")
+            )
+            return
+        
+        if not page.rows:
+            await query.edit_message_text(
+                "📋 Заданий пока нет.\n\n"
+                "Ожидайте, когда администратор создаст задания для ваших проектов.",
+                reply_markup=kb.back_button("user_main")
+            )
+            return
+        
+        text = "📋 Мои задания:\n\n"
+        keyboard = []
+        
+        for task, project, user_task in page.rows:
+            status_icon = "🆕" if not user_task else utils.format_task_status(user_task.status)
+            deadline_text = f"⏰ До {task.deadline.strftime('%d.%m.%Y %H:%M')}" if task.deadline else ""
             
-            # Получаем активные задания из проектов пользователя
-            tasks = session.query(Task).filter(
-                Task.project_id.in_(project_ids),
-                Task.is_active == True
-            ).all()
+            text += f"{status_icon} {task.title}\n"
+            text += f"   📂 {project.name}\n"
+            text += f"   {deadline_text}\n\n"
             
-            if not tasks:
-                await query.edit_message_text(
-                    "📋 Заданий пока нет.\n\n"
-                    "Ожидайте, когда администратор создаст задания для ваших проектов.",
-                    reply_markup=kb.back_button("user_main")
+            keyboard.append([
+                InlineKeyboardButton(
+                    f"{task.title} {status_icon}", 
+                    callback_data=cd.encode("task_detail_{int}", task.id)
                 )
-                return
-            
-            text = "📋 Мои задания:\n\n"
-            keyboard = []
-            
-            for task in tasks:
-                user_task = session.query(UserTask).filter(
-                    UserTask.user_id == user.id,
-                    UserTask.task_id == task.id
-                ).first()
-                
-                status_icon = "🆕" if not user_task else utils.format_task_status(user_task.status)
-                deadline_text = f"⏰ До {task.deadline.strftime('%d.%m.%Y %H:%M')}" if task.deadline else ""
-                project = session.query(Project).filter(Project.id == task.project_id).first()
-                
-                text += f"{status_icon} {task.title}\n"
-                text += f"   📂 {project.name}\n"
-                text += f"   {deadline_text}\n\n"
-                
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{task.title} {status_icon}", 
-                        callback_data=f"task_detail_{task.id}"
-                    )
-                ])
-            
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="user_main")])
-            
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
+            ])
+        
+        navigation = kb.pagination_buttons("my_tasks", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("user_main"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
-    async def show_user_answers(self, query, user):
-        session = get_db_session()
-        try:
-            user_tasks = session.query(UserTask).filter(
-                UserTask.user_id == user.id
-            ).join(Task).all()
-            
-            if not user_tasks:
-                await query.edit_message_text(
-                    "📤 У вас пока нет отправленных ответов.",
-                    reply_markup=kb.back_button("user_main")
-                )
-                return
-            
-            text = "📤 Мои ответы:\n\n"
-            keyboard = []
-            
-            for user_task in user_tasks:
-                task = user_task.task
-                project = session.query(Project).filter(Project.id == task.project_id).first()
-                status_icon = utils.format_task_status(user_task.status)
-                
-                text += f"{status_icon} {task.title}\n"
-                text += f"   📂 {project.name}\n"
-                text += f"   📅 {user_task.submitted_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-                
-                keyboard.append([
-                    InlineKeyboardButton(
-                        f"{task.title} {status_icon}", 
-                        callback_data=f"view_my_answer_{user_task.id}"
-                    )
-                ])
+    async def show_user_answers(self, query, user, direction='next', cursor=None):
+        page = await repo.get_user_answers(user.id, cursor=cursor, direction=direction)
+        
+        if not page.rows:
+            await query.edit_message_text(
+                "📤 У вас пока нет отправленных ответов.",
+                reply_markup=kb.back_button("user_main")
+            )
+            return
+        
+        text = "📤 Мои ответы:\n\n"
+        keyboard = []
+        
+        for user_task, task, project in page.rows:
+            status_icon = utils.format_task_status(user_task.status)
             
-            keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="user_main")])
+            text += f"{status_icon} {task.title}\n"
+            text += f"   📂 {project.name}\n"
+            text += f"   📅 {user_task.submitted_at.strftime('%d.%m.%Y %H:%M')}\n\n"
             
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
+            keyboard.append([
+                InlineKeyboardButton(
+                    f"{task.title} {status_icon}", 
+                    callback_data=cd.encode("view_my_answer_{int}", user_task.id)
+                )
+            ])
+        
+        navigation = kb.pagination_buttons("my_answers", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("user_main"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     async def show_user_profile(self, query, user):
-        session = get_db_session()
-        try:
-            projects_count = session.query(UserProject).filter(UserProject.user_id == user.id).count()
-            tasks_count = session.query(UserTask).filter(UserTask.user_id == user.id).count()
-            approved_count = session.query(UserTask).filter(
-                UserTask.user_id == user.id,
-                UserTask.status == 'approved'
-            ).count()
-            
-            text = f"👤 Ваш профиль:\n\n"
-            text += f"🆔 ID: {user.user_id}\n"
-            text += f"📛 Имя: {user.full_name}\n"
-            text += f"👤 Юзернейм: @{user.username if user.username else 'не указан'}\n"
-            text += f"🎯 Роль: {user.role}\n"
-            text += f"📛 Статус: {user.status}\n"
-            text += f"📅 Регистрация: {user.created_at.strftime('%d.%m.%Y')}\n\n"
-            text += f"📊 Статистика:\n"
-            text += f"   📁 Проектов: {projects_count}\n"
-            text += f"   📝 Ответов: {tasks_count}\n"
-            text += f"   ✅ Принято: {approved_count}\n"
-            
-            await query.edit_message_text(text, reply_markup=kb.profile_edit_menu())
-        finally:
-            session.close()
+        projects_count, tasks_count, approved_count = await repo.get_user_stats(user.id)
+        
+        text = f"👤 Ваш профиль:\n\n"
+        text += f"🆔 ID: {user.user_id}\n"
+        text += f"📛 Имя: {user.full_name}\n"
+        text += f"👤 Юзернейм: @{user.username if user.username else 'не указан'}\n"
+        text += f"🎯 Роль: {user.role}\n"
+        text += f"📛 Статус: {user.status}\n"
+        text += f"📅 Регистрация: {user.created_at.strftime('%d.%m.%Y')}\n\n"
+        text += f"📊 Статистика:\n"
+        text += f"   📁 Проектов: {projects_count}\n"
+        text += f"   📝 Ответов: {tasks_count}\n"
+        text += f"   ✅ Принято: {approved_count}\n"
+        
+        await query.edit_message_text(text, reply_markup=kb.profile_edit_menu())
     
     async def start_edit_name(self, query, context):
         context.user_data['state'] = 'waiting_edit_name'
@@ -195,103 +162,67 @@ class CallbackHandlers:
             reply_markup=kb.back_button("my_profile")
         )
     
-    async def show_common_board(self, query):
-        session = get_db_session()
-        try:
-            projects = session.query(Project).filter(
-                Project.is_archived == False
-            ).all()
-            
-            text = "📊 Общая доска проектов:\n\n"
-            
-            for project in projects:
-                participants_count = session.query(UserProject).filter(UserProject.project_id == project.id).count()
-                active_tasks = session.query(Task).filter(
-                    Task.project_id == project.id,
-                    Task.is_active == True
-                ).count()
-                
-                text += f"📂 {project.name}\n"
-                text += f"   👥 Участников: {participants_count}\n"
-                text += f"   📝 Активных заданий: {active_tasks}\n"
-                if project.board_link:
-                    text += f"   🔗 Доска: {project.board_link}\n"
-                text += "\n"
-            
-            await query.edit_message_text(
-                text,
-                reply_markup=kb.back_button("user_main")
-            )
-        finally:
-            session.close()
-    
-    async def handle_task_callback(self, query, context, data, user):
-        """Обработка callback'ов связанных с заданиями"""
-        if data.startswith("task_detail_"):
-            task_id = int(data.split('_')[2])
-            await self.show_task_detail(query, task_id, user)
-        elif data.startswith("answer_task_"):
-            task_id = int(data.split('_')[2])
-            await self.start_task_answer(query, context, task_id)
-        elif data.startswith("clarify_task_"):
-            task_id = int(data.split('_')[2])
-            await self.start_clarify_task(query, context, task_id)
-        elif data.startswith("view_my_answer_"):
-            user_task_id = int(data.split('_')[3])
-            await self.show_my_answer_detail(query, user_task_id)
+    async def show_common_board(self, query, direction='next', cursor=None):
+        page = await repo.get_projects_overview(archived=False, cursor=cursor, direction=direction)
+        
+        text = "📊 Общая доска проектов:\n\n"
+        
+        for project, participants_count, active_tasks, _ in page.rows:
+            text += f"📂 {project.name}\n"
+            text += f"   👥 Участников: {participants_count}\n"
+            text += f"   📝 Активных заданий: {active_tasks}\n"
+            if project.board_link:
+                text += f"   🔗 Доска: {project.board_link}\n"
+            text += "\n"
+        
+        keyboard = []
+        navigation = kb.pagination_buttons("common_board", page)
+        if navigation:
+            keyboard.append(navigation)
+        keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("user_main"))])
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     
     async def show_task_detail(self, query, task_id, user):
-        session = get_db_session()
-        try:
-            task = session.query(Task).filter(Task.id == task_id).first()
-            if not task:
-                await query.edit_message_text("❌ Задание не найдено")
-                return
-            
-            project = session.query(Project).filter(Project.id == task.project_id).first()
-            user_task = session.query(UserTask).filter(
-                UserTask.user_id == user.id,
-                UserTask.task_id == task_id
-            ).first()
-            
-            text = f"📝 {task.title}\n"
-            text += f"📂 Проект: {project.name}\n\n"
-            text += f"📄 {task.description}\n\n"
-            
-            if task.deadline:
-                text += f"⏰ Дедлайн: {task.deadline.strftime('%d.%m.%Y %H:%M')}\n\n"
-            
-            if user_task:
-                text += f"📤 Ваш ответ: {user_task.answer_text}\n"
-                if user_task.feedback:
-                    text += f"💬 Обратная связь: {user_task.feedback}\n"
-                text += f"🎯 Статус: {utils.format_task_status(user_task.status)}\n"
-                if user_task.reviewed_at:
-                    text += f"📅 Проверено: {user_task.reviewed_at.strftime('%d.%m.%Y %H:%M')}\n"
-            else:
-                text += "❌ Вы еще не отправили ответ на это задание.\n"
-            
-            has_answer = user_task is not None
-            await query.edit_message_text(text, reply_markup=kb.task_answer_menu(task_id, has_answer))
-        finally:
-            session.close()
+        detail = await repo.get_task_detail(task_id, user.id)
+        if not detail:
+            await query.edit_message_text("❌ Задание не найдено")
+            return
+        
+        task, project, user_task = detail
+        
+        text = f"📝 {task.title}\n"
+        text += f"📂 Проект: {project.name}\n\n"
+        text += f"📄 {task.description}\n\n"
+        
+        if task.deadline:
+            text += f"⏰ Дедлайн: {task.deadline.strftime('%d.%m.%Y %H:%M')}\n\n"
+        
+        if user_task:
+            text += f"📤 Ваш ответ: {user_task.answer_text}\n"
+            if user_task.feedback:
+                text += f"💬 Обратная связь: {user_task.feedback}\n"
+            text += f"🎯 Статус: {utils.format_task_status(user_task.status)}\n"
+            if user_task.reviewed_at:
+                text += f"📅 Проверено: {user_task.reviewed_at.strftime('%d.%m.%Y %H:%M')}\n"
+        else:
+            text += "❌ Вы еще не отправили ответ на это задание.\n"
+        
+        has_answer = user_task is not None
+        await query.edit_message_text(text, reply_markup=kb.task_answer_menu(task_id, has_answer))
     
     async def start_task_answer(self, query, context, task_id):
         context.user_data['current_task_id'] = task_id
         context.user_data['state'] = 'waiting_task_answer'
         
-        session = get_db_session()
-        try:
-            task = session.query(Task).filter(Task.id == task_id).first()
-            if task:
-                await query.edit_message_text(
-                    f"📝 Ответ на задание: {task.title}\n\n"
-                    f"📄 Описание: {task.description}\n\n"
-                    "💬 Напишите ваш ответ текстом:",
-                    reply_markup=kb.back_button(f"task_detail_{task_id}")
-                )
-        finally:
-            session.close()
+        task = await repo.get_task(task_id)
+        if task:
+            await query.edit_message_text(
+                f"📝 Ответ на задание: {task.title}\n\n"
+                f"📄 Описание: {task.description}\n\n"
+                "💬 Напишите ваш ответ текстом:",
+                reply_markup=kb.back_button("task_detail_{int}", task_id)
+            )
     
     async def start_clarify_task(self, query, context, task_id):
         context.user_data['clarify_task_id'] = task_id
@@ -299,35 +230,30 @@ class CallbackHandlers:
         
         await query.edit_message_text(
             "❓ Введите ваш вопрос по заданию:",
-            reply_markup=kb.back_button(f"task_detail_{task_id}")
+            reply_markup=kb.back_button("task_detail_{int}", task_id)
         )
     
     async def show_my_answer_detail(self, query, user_task_id):
-        session = get_db_session()
-        try:
-            user_task = session.query(UserTask).filter(UserTask.id == user_task_id).first()
-            if not user_task:
-                await query.edit_message_text("❌ Ответ не найден")
-                return
-            
-            task = user_task.task
-            project = session.query(Project).filter(Project.id == task.project_id).first()
-            
-            text = f"📝 {task.title}\n"
-            text += f"📂 Проект: {project.name}\n\n"
-            text += f"📤 Ваш ответ: {user_task.answer_text}\n\n"
-            text += f"🎯 Статус: {utils.format_task_status(user_task.status)}\n"
-            if user_task.feedback:
-                text += f"💬 Обратная связь: {user_task.feedback}\n"
-            text += f"📅 Отправлен: {user_task.submitted_at.strftime('%d.%m.%Y %H:%M')}\n"
-            if user_task.reviewed_at:
-                text += f"📅 Проверено: {user_task.reviewed_at.strftime('%d.%m.%Y %H:%M')}\n"
-            
-            keyboard = [
-                [InlineKeyboardButton("✏️ Изменить ответ", callback_data=f"answer_task_{task.id}")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="my_answers")]
-            ]
-            
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-        finally:
-            session.close()
\ No newline at end of file
+        detail = await repo.get_user_answer_detail(user_task_id)
+        if not detail:
+            await query.edit_message_text("❌ Ответ не найден")
+            return
+        
+        user_task, task, project = detail
+        
+        text = f"📝 {task.title}\n"
+        text += f"📂 Проект: {project.name}\n\n"
+        text += f"📤 Ваш ответ: {user_task.answer_text}\n\n"
+        text += f"🎯 Статус: {utils.format_task_status(user_task.status)}\n"
+        if user_task.feedback:
+            text += f"💬 Обратная связь: {user_task.feedback}\n"
+        text += f"📅 Отправлен: {user_task.submitted_at.strftime('%d.%m.%Y %H:%M')}\n"
+        if user_task.reviewed_at:
+            text += f"📅 Проверено: {user_task.reviewed_at.strftime('%d.%m.%Y %H:%M')}\n"
+        
+        keyboard = [
+            [InlineKeyboardButton("✏️ Изменить ответ", callback_data=cd.encode("answer_task_{int}", task.id))],
+            [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("my_answers"))]
+        ]
+        
+        await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
\ No newline at end of file
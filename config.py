@@ -7,9 +7,97 @@ BOT_TOKEN = os.getenv('BOT_TOKEN', 'YOUR_BOT_TOKEN_HERE')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'kub000')
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot_database.db')
 
+# Самопинг /healthz по WEBHOOK_URL, чтобы хостинг не усыплял сервис (секунды, 0 - выключен)
+SELF_PING_INTERVAL = int(os.getenv('SELF_PING_INTERVAL', 300))
+# Сколько секунд /healthz ждет ответа БД
+HEALTH_DB_TIMEOUT = float(os.getenv('HEALTH_DB_TIMEOUT', 2))
+
+# Проверка схемы БД при старте: auto - только при смене версии схемы, always - каждый раз, never - не проверять
+SCHEMA_CHECK = os.getenv('SCHEMA_CHECK', 'auto')
+
+# Адрес Bot API (пусто - api.telegram.org); для нагрузочных тестов - local_bot_api.py
+BOT_API_URL = os.getenv('BOT_API_URL', '').rstrip('/')
+
+# Количество потоков для запросов к БД
+DB_WORKERS = int(os.getenv('DB_WORKERS', 4))
+
+# Пул соединений для серверных БД (PostgreSQL и т.п.); для SQLite не используется
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', DB_WORKERS))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 4))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# Настройки SQLite: журнал, синхронизация, ожидание блокировки (мс), mmap (байты), кэш страниц (КиБ)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+
+# Сколько апдейтов обрабатывать параллельно и сколько держать необработанными
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', 16))
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', 256))
+
+# Callback'и дольше этого порога (мс) пишутся в лог
+SLOW_CALLBACK_MS = int(os.getenv('SLOW_CALLBACK_MS', 500))
+
+# Сколько длинных callback-аргументов хранить в памяти (LRU)
+CALLBACK_STORE_SIZE = int(os.getenv('CALLBACK_STORE_SIZE', 10000))
+
+# Сколько клавиатур с параметрами держать в кэше
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', 2048))
+
+# Как часто сбрасывать состояние диалогов в БД (секунды)
+PERSISTENCE_INTERVAL = int(os.getenv('PERSISTENCE_INTERVAL', 30))
+
+# Сколько секунд держать в памяти список админов
+ADMIN_ROSTER_TTL = int(os.getenv('ADMIN_ROSTER_TTL', 300))
+
+# Кэш пользователей по Telegram ID: сколько секунд держать и сколько записей максимум
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Бюджет одного апдейта: число SQL-запросов и время БД (мс); сверх - предупреждение в лог
+UPDATE_QUERY_BUDGET = int(os.getenv('UPDATE_QUERY_BUDGET', 10))
+UPDATE_DB_BUDGET_MS = int(os.getenv('UPDATE_DB_BUDGET_MS', 300))
+# Запросы дольше порога (мс) пишутся в лог вместе с параметрами
+SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))
+
+# Количество строк на одной странице списков
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 10))
+
+# Настройки рассылки (лимиты Telegram: ~30 сообщений/с всего и 1 сообщение/с в один чат)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 25))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', 1))
+SEND_CHAT_BUCKETS = int(os.getenv('SEND_CHAT_BUCKETS', 10000))
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', 8))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', 3))
+SEND_PROGRESS_INTERVAL = float(os.getenv('SEND_PROGRESS_INTERVAL', 3))
+DEAD_LETTER_LIMIT = int(os.getenv('DEAD_LETTER_LIMIT', 1000))
+
+# Настройки outbox уведомлений
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 5))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 300))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', 60))
+# Сколько секунд при остановке бота ждать доотправки текущей пачки
+OUTBOX_STOP_TIMEOUT = float(os.getenv('OUTBOX_STOP_TIMEOUT', 10))
+
+# Сводка админам об ответах и вопросах: раз в N минут или сразу после M событий (0 минут - каждое событие сразу)
+ADMIN_DIGEST_MINUTES = int(os.getenv('ADMIN_DIGEST_MINUTES', 0))
+ADMIN_DIGEST_MAX_EVENTS = int(os.getenv('ADMIN_DIGEST_MAX_EVENTS', 20))
+
+# Напоминания о дедлайнах: за сколько часов до дедлайна и как часто проверять
+REMINDER_OFFSETS = [float(hours) for hours in os.getenv('REMINDER_OFFSETS', '24,1').split(',') if hours.strip()]
+REMINDER_INTERVAL = int(os.getenv('REMINDER_INTERVAL', 60))
+REMINDER_LOOKBACK = int(os.getenv('REMINDER_LOOKBACK', 3600))
+
 # Настройки времени
 TIMEZONE = 'Europe/Moscow'
 
 # Настройки для Render.com
 WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
-PORT = int(os.getenv('PORT', 8443))
\ No newline at end of file
+PORT = int(os.getenv('PORT', 8443))
+# Метрики Prometheus (/metrics): по умолчанию только в режиме webhook, где их есть кому отдать
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1' if WEBHOOK_URL else '0') == '1'
@@ -1,10 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, make_url, event, inspect, text, Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import contextvars
+import logging
+import time
 import config
 import json
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 class User(Base):
@@ -12,9 +20,9 @@ class User(Base):
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, unique=True, nullable=False)
-    username = Column(String(100))
+    username = Column(String(100), index=True)
     full_name = Column(String(200), nullable=False)
-    role = Column(String(50), default='user')
+    role = Column(String(50), default='user', index=True)
     status = Column(String(100), default='Участник')
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -38,6 +46,11 @@ class UserProject(Base):
     project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
     role_in_project = Column(String(100), default='participant')
     joined_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('uq_user_projects_user_project', 'user_id', 'project_id', unique=True),
+        Index('ix_user_projects_project_id', 'project_id'),
+    )
 
 class Task(Base):
     __tablename__ = 'tasks'
@@ -51,7 +64,26 @@ class Task(Base):
     created_at = Column(DateTime, default=datetime.now)
     created_by = Column(Integer, ForeignKey('users.id'))
     is_active = Column(Boolean, default=True)
-    target_users = Column(JSON)  # Список user_id, кому назначено задание
+    target_users = Column(JSON)  # Устарело: назначения хранятся в task_assignments, колонка нужна для переноса
+    
+    __table_args__ = (
+        Index('ix_tasks_project_active', 'project_id', 'is_active'),
+        Index('ix_tasks_active_deadline', 'is_active', 'deadline'),
+    )
+
+class TaskAssignment(Base):
+    __tablename__ = 'task_assignments'
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey('tasks.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    assigned_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('uq_task_assignments_task_user', 'task_id', 'user_id', unique=True),
+        # "Мои задания": задания пользователя по порядку id
+        Index('ix_task_assignments_user_task', 'user_id', 'task_id'),
+    )
 
 class UserTask(Base):
     __tablename__ = 'user_tasks'
@@ -66,6 +98,11 @@ class UserTask(Base):
     submitted_at = Column(DateTime, default=datetime.now)
     reviewed_at = Column(DateTime)
     clarification_question = Column(Text)  # Вопрос от пользователя
+    
+    __table_args__ = (
+        Index('uq_user_tasks_user_task', 'user_id', 'task_id', unique=True),
+        Index('ix_user_tasks_task_status', 'task_id', 'status'),
+    )
 
 class Notification(Base):
     __tablename__ = 'notifications'
@@ -75,8 +112,43 @@ class Notification(Base):
     task_id = Column(Integer, ForeignKey('tasks.id'))
     message = Column(Text)
     message_type = Column(String(50), default='info')  # info, feedback, clarification
+    reply_markup = Column(JSON)  # Клавиатура в формате Bot API
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.now)
+    # Состояние доставки: pending, sending, delivered, failed; digest - ждет сводки админу, digested - вошло в сводку
+    status = Column(String(20), default='pending')
+    attempts = Column(Integer, default=0)
+    claimed_at = Column(DateTime)
+    delivered_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index('ix_notifications_status_id', 'status', 'id'),
+    )
+
+class TaskReminder(Base):
+    __tablename__ = 'task_reminders'
+    
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, ForeignKey('tasks.id'), nullable=False)
+    offset_minutes = Column(Integer, nullable=False)  # За сколько минут до дедлайна
+    sent_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index('uq_task_reminders_task_offset', 'task_id', 'offset_minutes', unique=True),
+    )
+
+class BotState(Base):
+    __tablename__ = 'bot_state'
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(100), nullable=False)  # user, chat, bot, conversation:<имя>, schema, migration
+    key = Column(String(200), nullable=False)
+    data = Column(JSON)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    __table_args__ = (
+        Index('uq_bot_state_kind_key', 'kind', 'key', unique=True),
+    )
 
 class AdminAction(Base):
     __tablename__ = 'admin_actions'
@@ -89,9 +161,263 @@ class AdminAction(Base):
     created_at = Column(DateTime, default=datetime.now)
 
 # Инициализация базы данных
-engine = create_engine(config.DATABASE_URL)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+def _engine_options(url):
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    # Серверная БД: соединений хватает на все потоки БД, мертвые проверяются перед выдачей
+    return {
+        'pool_size': config.DB_POOL_SIZE,
+        'max_overflow': config.DB_MAX_OVERFLOW,
+        'pool_timeout': config.DB_POOL_TIMEOUT,
+        'pool_recycle': config.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+engine = create_engine(config.DATABASE_URL, **_engine_options(make_url(config.DATABASE_URL)))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: читатели не ждут писателя; busy_timeout вместо мгновенного "database is locked"
+    cursor = dbapi_connection.cursor()
+    try:
+        if config.SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+        # Отрицательное значение - размер в КиБ, а не в страницах
+        cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    finally:
+        cursor.close()
+
+if engine.dialect.name == 'sqlite':
+    event.listen(engine, 'connect', _sqlite_pragmas)
+
+class QueryStats:
+    """Сколько запросов и времени БД ушло на один апдейт"""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+# Счетчик текущего апдейта; попадает в поток БД вместе с контекстом (см. run_db)
+update_query_stats = contextvars.ContextVar('update_query_stats', default=None)
+
+# Внешние наблюдатели запросов: callback(statement, parameters, seconds)
+query_listeners = []
+
+# Время начала хранится в контексте выполнения, а не в стеке соединения:
+# упавший запрос не оставит запись, которая собьет замеры следующих
+@event.listens_for(engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_started
+    stats = update_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+    if elapsed * 1000 >= config.SLOW_QUERY_MS:
+        logger.warning(f"Slow query {elapsed * 1000:.0f} ms: {' '.join(statement.split())} params={str(parameters)[:500]}")
+    for listener in query_listeners:
+        listener(statement, parameters, elapsed)
+
+# Уникальные индексы и правило: какую из дублирующихся строк оставить
+UNIQUE_INDEX_DEDUPE = {
+    'uq_user_tasks_user_task': ('user_tasks', ('user_id', 'task_id'), 'MAX'),
+    'uq_user_projects_user_project': ('user_projects', ('user_id', 'project_id'), 'MIN'),
+}
+
+def migrate_schema():
+    """Добавляет колонки и индексы в уже существующую базу (create_all не трогает готовые таблицы)"""
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=conn.dialect)
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if isinstance(default, bool):
+                    default = int(default)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if default is not None:
+                    ddl += f" DEFAULT {default!r}"
+                conn.execute(text(ddl))
+            
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.name in UNIQUE_INDEX_DEDUPE:
+                    # Перед созданием уникального индекса удаляем дубликаты
+                    table_name, columns, keep = UNIQUE_INDEX_DEDUPE[index.name]
+                    group_by = ', '.join(columns)
+                    conn.execute(text(
+                        f"DELETE FROM {table_name} WHERE id NOT IN "
+                        f"(SELECT {keep}(id) FROM {table_name} GROUP BY {group_by})"
+                    ))
+                index.create(conn)
+
+def backfill_task_assignments():
+    """Переносит назначения из Task.target_users в task_assignments. Выполняется один раз:
+    отметка о переносе хранится в bot_state"""
+    state = BotState.__table__
+    done = (state.c.kind == 'migration') & (state.c.key == 'task_assignments')
+    with engine.begin() as conn:
+        if conn.execute(state.select().with_only_columns(state.c.id).where(done)).first():
+            return
+        # Базы, перенесенные до появления отметки: назначения уже есть, повторять нельзя
+        if not conn.execute(text("SELECT 1 FROM task_assignments LIMIT 1")).first():
+            user_ids = {row[0] for row in conn.execute(text("SELECT id FROM users"))}
+            members = {}
+            for user_id, project_id in conn.execute(text("SELECT user_id, project_id FROM user_projects")):
+                members.setdefault(project_id, []).append(user_id)
+
+            rows = []
+            tasks = conn.execute(Task.__table__.select().with_only_columns(Task.id, Task.project_id, Task.target_users))
+            for task_id, project_id, target_users in tasks:
+                # Без target_users задание было для всех участников проекта
+                targets = target_users if target_users is not None else members.get(project_id, [])
+                for user_id in dict.fromkeys(targets):
+                    if user_id in user_ids:
+                        rows.append({'task_id': task_id, 'user_id': user_id, 'assigned_at': datetime.now()})
+            if rows:
+                conn.execute(TaskAssignment.__table__.insert(), rows)
+                logger.info(f"Backfilled {len(rows)} task assignments")
+        conn.execute(state.insert().values(kind='migration', key='task_assignments', data=True, updated_at=datetime.now()))
+
+# Версия схемы: увеличивать при изменении моделей, индексов или переносов данных -
+# тогда при следующем старте prepare_schema снова выполнит проверки
+SCHEMA_VERSION = 1
+
+def _stored_schema_version():
+    table = BotState.__table__
+    try:
+        with engine.connect() as conn:
+            row = conn.execute(
+                table.select().with_only_columns(table.c.data).where(table.c.kind == 'schema', table.c.key == 'version')
+            ).first()
+    except Exception:
+        # Таблиц еще нет - новая база
+        return None
+    return row[0] if row else None
+
+def prepare_schema(force=False):
+    """Создает таблицы, мигрирует схему и переносит данные, если версия схемы в БД
+    отличается от SCHEMA_VERSION (или force). Возвращает True, если проверки выполнялись"""
+    if not force and _stored_schema_version() == SCHEMA_VERSION:
+        return False
+    Base.metadata.create_all(engine)
+    migrate_schema()
+    backfill_task_assignments()
+    table = BotState.__table__
+    with engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.kind == 'schema', table.c.key == 'version'))
+        conn.execute(table.insert().values(kind='schema', key='version', data=SCHEMA_VERSION, updated_at=datetime.now()))
+    logger.info(f"Database schema checked (version {SCHEMA_VERSION})")
+    return True
+
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+# Пул потоков для запросов к БД, чтобы синхронный SQLAlchemy не блокировал event loop
+db_executor = ThreadPoolExecutor(max_workers=config.DB_WORKERS, thread_name_prefix='db')
 
 def get_db_session():
-    return Session()
\ No newline at end of file
+    return Session()
+
+def _run_in_session(func, args, kwargs):
+    session = Session()
+    try:
+        result = func(session, *args, **kwargs)
+        session.commit()
+        return result
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+class UnitOfWork:
+    """Одна сессия на несколько вызовов run_db: изменения сбрасываются в БД, коммит - один в конце"""
+
+    def __init__(self):
+        self.session = Session()
+        # Вызовы выполняются по одному: сессию нельзя использовать из двух потоков сразу
+        self.lock = asyncio.Lock()
+        # Свой поток, а не общий db_executor: после первого flush блок держит блокировку записи
+        # SQLite, и если общий пул займут писатели, ждущие эту блокировку, блок не сможет
+        # выполнить следующий шаг и коммит, пока они не упадут по busy_timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-uow')
+        self.active = True
+
+    def _call(self, func, args, kwargs):
+        result = func(self.session, *args, **kwargs)
+        self.session.flush()
+        return result
+
+    def _finish(self, commit):
+        try:
+            if commit:
+                self.session.commit()
+            else:
+                self.session.rollback()
+        finally:
+            self.session.close()
+
+    async def _execute(self, target, *args):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, context.run, target, *args)
+
+    async def run(self, func, args, kwargs):
+        return await self._execute(self._call, func, args, kwargs)
+
+    async def finish(self, commit):
+        self.active = False
+        try:
+            await self._execute(self._finish, commit)
+        finally:
+            self.executor.shutdown(wait=False)
+
+# Текущая единица работы: run_db внутри блока unit_of_work() идут в ее сессию
+current_unit_of_work = contextvars.ContextVar('current_unit_of_work', default=None)
+
+@contextlib.asynccontextmanager
+async def unit_of_work():
+    """Все run_db внутри блока - одна транзакция: коммит при выходе, откат при исключении.
+
+    Ошибки БД ловить снаружи блока, иначе закоммитится прерванная транзакция.
+    """
+    outer = current_unit_of_work.get()
+    if outer is not None and outer.active:
+        # Вложенный блок становится частью внешнего
+        yield outer
+        return
+
+    uow = UnitOfWork()
+    token = current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        await uow.finish(commit=False)
+        raise
+    else:
+        await uow.finish(commit=True)
+    finally:
+        current_unit_of_work.reset(token)
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет func(session, *args, **kwargs) в пуле потоков в отдельной транзакции
+    (или в транзакции текущего unit_of_work)"""
+    uow = current_unit_of_work.get()
+    if uow is not None and uow.active:
+        return await uow.run(func, args, kwargs)
+    loop = asyncio.get_running_loop()
+    # Копируем контекст, чтобы запросы учитывались в счетчике текущего апдейта
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, context.run, _run_in_session, func, args, kwargs)
\ No newline at end of file
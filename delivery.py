@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden, BadRequest
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Результаты send: доставлено; не доставлено, но можно повторить позже; отклонено навсегда
+SENT, FAILED, REJECTED = 'sent', 'failed', 'rejected'
+
+class TokenBucket:
+    """Простой token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self):
+        """Сколько секунд ждать до следующего токена (0 - можно сразу)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill()
+        self.tokens -= 1
+
+    async def acquire(self):
+        while True:
+            delay = self.delay()
+            if delay == 0:
+                self.consume()
+                return
+            await asyncio.sleep(delay)
+
+class DeliveryEngine:
+    """Отправка сообщений с учетом лимитов Telegram, повторами и учетом недоставленных"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.global_bucket = TokenBucket(config.SEND_GLOBAL_RATE, config.SEND_GLOBAL_RATE)
+        self.chat_buckets = OrderedDict()
+        self.semaphore = asyncio.Semaphore(config.SEND_CONCURRENCY)
+        self.dead_letters = deque(maxlen=config.DEAD_LETTER_LIMIT)
+        self.paused_until = 0
+        self.background_tasks = set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(config.SEND_CHAT_RATE, 1)
+        # Храним ограниченное число корзин; вытесняется самая давно использованная
+        self.chat_buckets[chat_id] = bucket
+        if len(self.chat_buckets) > config.SEND_CHAT_BUCKETS:
+            self.chat_buckets.popitem(last=False)
+        return bucket
+
+    async def _wait_for_chat(self, chat_id):
+        # После 429 ждем паузу, которую попросил Telegram
+        pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        await self._chat_bucket(chat_id).acquire()
+
+    async def send(self, chat_id, text, **kwargs):
+        """Отправляет сообщение; возвращает SENT, иначе кладет его в dead letters и возвращает
+        REJECTED (чат недоступен, повтор не поможет) или FAILED"""
+        return await self._deliver(chat_id, text, lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs))
+
+    async def edit(self, chat_id, message_id, text, **kwargs):
+        """Редактирует сообщение с теми же лимитами и повторами, что и send"""
+        return await self._deliver(chat_id, text, lambda: self.bot.edit_message_text(
+            text, chat_id=chat_id, message_id=message_id, **kwargs
+        ))
+
+    async def _deliver(self, chat_id, text, request):
+        error = None
+        result = FAILED
+        for attempt in range(1, config.SEND_MAX_RETRIES + 1):
+            # Ожидания чата и паузы - до семафора: занятый чат не должен держать слоты остальных
+            await self._wait_for_chat(chat_id)
+            backoff = 0
+            async with self.semaphore:
+                await self.global_bucket.acquire()
+                try:
+                    await request()
+                    metrics.SENDS.labels('ok').inc()
+                    return SENT
+                except RetryAfter as e:
+                    metrics.SENDS.labels('retry_after').inc()
+                    error = e
+                    retry_after = e.retry_after
+                    if isinstance(retry_after, timedelta):
+                        retry_after = retry_after.total_seconds()
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                    logger.warning(f"Flood limit for chat {chat_id}, retry in {retry_after}s")
+                except (Forbidden, BadRequest) as e:
+                    # Пользователь заблокировал бота или чат недоступен - повтор не поможет
+                    metrics.SENDS.labels('rejected').inc()
+                    error = e
+                    result = REJECTED
+                    break
+                except (TimedOut, NetworkError) as e:
+                    metrics.SENDS.labels('network_error').inc()
+                    error = e
+                    backoff = min(2 ** attempt, 30)
+                except Exception as e:
+                    metrics.SENDS.labels('error').inc()
+                    error = e
+                    break
+            if backoff:
+                await asyncio.sleep(backoff)
+
+        metrics.SENDS.labels('dead_letter').inc()
+        self.dead_letters.append({
+            'chat_id': chat_id,
+            'text': text,
+            'error': str(error),
+            'failed_at': datetime.now()
+        })
+        metrics.DEAD_LETTERS.set(len(self.dead_letters))
+        logger.error(f"Error sending message to {chat_id}: {error}")
+        return result
+
+    async def send_many(self, messages, on_progress=None):
+        """Отправляет список словарей с параметрами send; возвращает (доставлено, ошибок)"""
+        total = len(messages)
+        counters = {'sent': 0, 'failed': 0}
+        last_report = 0
+
+        async def deliver(message):
+            nonlocal last_report
+            if await self.send(**message) == SENT:
+                counters['sent'] += 1
+            else:
+                counters['failed'] += 1
+
+            done = counters['sent'] + counters['failed']
+            now = time.monotonic()
+            if on_progress and done < total and now - last_report >= config.SEND_PROGRESS_INTERVAL:
+                last_report = now
+                try:
+                    await on_progress(counters['sent'], counters['failed'], total)
+                except Exception as e:
+                    logger.error(f"Error reporting delivery progress: {e}")
+
+        await asyncio.gather(*(deliver(message) for message in messages))
+
+        if on_progress:
+            try:
+                await on_progress(counters['sent'], counters['failed'], total)
+            except Exception as e:
+                logger.error(f"Error reporting delivery progress: {e}")
+        return counters['sent'], counters['failed']
+
+    def send_in_background(self, messages, on_progress=None):
+        """Запускает send_many фоновой задачей, не блокируя обработчик"""
+        task = asyncio.create_task(self.send_many(messages, on_progress))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
@@ -0,0 +1,25 @@
+import logging
+from datetime import datetime, timedelta
+import repository as repo
+import config
+
+logger = logging.getLogger(__name__)
+
+class AdminDigests:
+    """Периодически отправляет админам сводки накопившихся ответов и вопросов"""
+
+    def schedule(self, job_queue):
+        if job_queue is None:
+            logger.warning("JobQueue is not available, admin digests are disabled")
+            return
+        # Работает и при выключенном режиме сводки: досылает то, что успело накопиться раньше
+        job_queue.run_repeating(self.tick, interval=60, first=30, name='admin_digests')
+
+    async def tick(self, context):
+        ready_before = datetime.now() - timedelta(minutes=config.ADMIN_DIGEST_MINUTES)
+        try:
+            count = await repo.flush_admin_digests(ready_before)
+            if count:
+                logger.info(f"Queued {count} admin digests")
+        except Exception as e:
+            logger.error(f"Error queueing admin digests: {e}")
@@ -1,102 +1,127 @@
+import functools
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import callback_codec as cd
+import config
+
+# Клавиатуры неизменяемы, поэтому один объект можно отдавать во все ответы
+def prebuilt(build):
+    """Статическое меню: строится один раз при импорте"""
+    markup = build()
+    
+    @functools.wraps(build)
+    def get():
+        return markup
+    return get
+
+# Меню с параметрами (id задания, проекта...) - ограниченный LRU
+cached = functools.lru_cache(maxsize=config.KEYBOARD_CACHE_SIZE)
 
 # Главное меню админа
+@prebuilt
 def admin_main_menu():
     keyboard = [
-        [InlineKeyboardButton("👥 Управление админами", callback_data="admin_manage")],
-        [InlineKeyboardButton("📁 Управление проектами", callback_data="admin_projects")],
-        [InlineKeyboardButton("📝 Дать задание", callback_data="admin_create_task")],
-        [InlineKeyboardButton("📊 Посмотреть ответы", callback_data="admin_view_answers")],
-        [InlineKeyboardButton("👤 Управление пользователями", callback_data="admin_users")],
-        [InlineKeyboardButton("📢 Рассылка/обратная связь", callback_data="admin_broadcast")],
-        [InlineKeyboardButton("🗄 Архив проектов", callback_data="admin_archive")],
-        [InlineKeyboardButton("🔙 Выйти из админки", callback_data="exit_admin")]
+        [InlineKeyboardButton("👥 Управление админами", callback_data=cd.encode("admin_manage"))],
+        [InlineKeyboardButton("📁 Управление проектами", callback_data=cd.encode("admin_projects"))],
+        [InlineKeyboardButton("📝 Дать задание", callback_data=cd.encode("admin_create_task"))],
+        [InlineKeyboardButton("📊 Посмотреть ответы", callback_data=cd.encode("admin_view_answers"))],
+        [InlineKeyboardButton("👤 Управление пользователями", callback_data=cd.encode("admin_users"))],
+        [InlineKeyboardButton("📢 Рассылка/обратная связь", callback_data=cd.encode("admin_broadcast"))],
+        [InlineKeyboardButton("🗄 Архив проектов", callback_data=cd.encode("admin_archive"))],
+        [InlineKeyboardButton("🔙 Выйти из админки", callback_data=cd.encode("exit_admin"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню управления проектами
+@prebuilt
 def projects_management_menu():
     keyboard = [
-        [InlineKeyboardButton("📋 Список проектов", callback_data="projects_list")],
-        [InlineKeyboardButton("➕ Создать проект", callback_data="project_create")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_main")]
+        [InlineKeyboardButton("📋 Список проектов", callback_data=cd.encode("projects_list"))],
+        [InlineKeyboardButton("➕ Создать проект", callback_data=cd.encode("project_create"))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню действий с проектом
+@cached
 def project_actions_menu(project_id):
     keyboard = [
-        [InlineKeyboardButton("👥 Участники", callback_data=f"project_users_{project_id}")],
-        [InlineKeyboardButton("📝 Задания", callback_data=f"project_tasks_{project_id}")],
-        [InlineKeyboardButton("🔗 Добавить доску", callback_data=f"project_add_board_{project_id}")],
-        [InlineKeyboardButton("✏️ Изменить", callback_data=f"project_edit_{project_id}")],
-        [InlineKeyboardButton("🗄 Архивировать", callback_data=f"project_archive_{project_id}")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_projects")]
+        [InlineKeyboardButton("👥 Участники", callback_data=cd.encode("project_users_{int}", project_id))],
+        [InlineKeyboardButton("📝 Задания", callback_data=cd.encode("project_tasks_{int}", project_id))],
+        [InlineKeyboardButton("🔗 Добавить доску", callback_data=cd.encode("project_add_board_{int}", project_id))],
+        [InlineKeyboardButton("✏️ Изменить", callback_data=cd.encode("project_edit_{int}", project_id))],
+        [InlineKeyboardButton("🗄 Архивировать", callback_data=cd.encode("project_archive_{int}", project_id))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_projects"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню пользователя
+@prebuilt
 def user_main_menu():
     keyboard = [
-        [InlineKeyboardButton("📋 Мои задания", callback_data="my_tasks")],
-        [InlineKeyboardButton("📤 Мои ответы", callback_data="my_answers")],
-        [InlineKeyboardButton("👤 Мой профиль", callback_data="my_profile")],
-        [InlineKeyboardButton("📊 Общая доска", callback_data="common_board")]
+        [InlineKeyboardButton("📋 Мои задания", callback_data=cd.encode("my_tasks"))],
+        [InlineKeyboardButton("📤 Мои ответы", callback_data=cd.encode("my_answers"))],
+        [InlineKeyboardButton("👤 Мой профиль", callback_data=cd.encode("my_profile"))],
+        [InlineKeyboardButton("📊 Общая доска", callback_data=cd.encode("common_board"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
-# Кнопка назад
-def back_button(back_to):
-    return InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data=back_to)]])
+# Кнопка назад: маршрут и его аргументы
+@cached
+def back_button(back_to, *args):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data=cd.encode(back_to, *args))]])
 
 # Подтверждение действий
-def confirmation_buttons(action, data=""):
+@cached
+def confirmation_buttons(action, data):
     keyboard = [
         [
-            InlineKeyboardButton("✅ Да", callback_data=f"confirm_{action}_{data}"),
-            InlineKeyboardButton("❌ Нет", callback_data="cancel_action")
+            InlineKeyboardButton("✅ Да", callback_data=cd.encode(f"confirm_{action}_{{int}}", data)),
+            InlineKeyboardButton("❌ Нет", callback_data=cd.encode("cancel_action"))
         ]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню управления админами
+@prebuilt
 def admin_management_menu():
     keyboard = [
-        [InlineKeyboardButton("➕ Добавить админа", callback_data="admin_add")],
-        [InlineKeyboardButton("➖ Удалить админа", callback_data="admin_remove")],
-        [InlineKeyboardButton("📋 Список админов", callback_data="admin_list")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_main")]
+        [InlineKeyboardButton("➕ Добавить админа", callback_data=cd.encode("admin_add"))],
+        [InlineKeyboardButton("➖ Удалить админа", callback_data=cd.encode("admin_remove"))],
+        [InlineKeyboardButton("📋 Список админов", callback_data=cd.encode("admin_list"))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню для ответов на задания
+@cached
 def task_answer_menu(task_id, has_answer=False):
     if has_answer:
         keyboard = [
-            [InlineKeyboardButton("✏️ Изменить ответ", callback_data=f"answer_task_{task_id}")],
-            [InlineKeyboardButton("📝 Дополнить", callback_data=f"supplement_answer_{task_id}")],
-            [InlineKeyboardButton("🗑️ Удалить ответ", callback_data=f"delete_answer_{task_id}")],
-            [InlineKeyboardButton("❓ Уточнить задание", callback_data=f"clarify_task_{task_id}")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="my_tasks")]
+            [InlineKeyboardButton("✏️ Изменить ответ", callback_data=cd.encode("answer_task_{int}", task_id))],
+            [InlineKeyboardButton("📝 Дополнить", callback_data=cd.encode("supplement_answer_{int}", task_id))],
+            [InlineKeyboardButton("🗑️ Удалить ответ", callback_data=cd.encode("delete_answer_{int}", task_id))],
+            [InlineKeyboardButton("❓ Уточнить задание", callback_data=cd.encode("clarify_task_{int}", task_id))],
+            [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("my_tasks"))]
         ]
     else:
         keyboard = [
-            [InlineKeyboardButton("📝 Ответить", callback_data=f"answer_task_{task_id}")],
-            [InlineKeyboardButton("❓ Уточнить задание", callback_data=f"clarify_task_{task_id}")],
-            [InlineKeyboardButton("🔙 Назад", callback_data="my_tasks")]
+            [InlineKeyboardButton("📝 Ответить", callback_data=cd.encode("answer_task_{int}", task_id))],
+            [InlineKeyboardButton("❓ Уточнить задание", callback_data=cd.encode("clarify_task_{int}", task_id))],
+            [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("my_tasks"))]
         ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню модерации ответа
+@cached
 def answer_moderation_menu(user_task_id):
     keyboard = [
         [
-            InlineKeyboardButton("✅ Утвердить", callback_data=f"approve_answer_{user_task_id}"),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_answer_{user_task_id}")
+            InlineKeyboardButton("✅ Утвердить", callback_data=cd.encode("approve_answer_{int}", user_task_id)),
+            InlineKeyboardButton("❌ Отклонить", callback_data=cd.encode("reject_answer_{int}", user_task_id))
         ],
-        [InlineKeyboardButton("💬 Дать обратную связь", callback_data=f"feedback_answer_{user_task_id}")],
-        [InlineKeyboardButton("📋 История ответов", callback_data=f"answer_history_{user_task_id}")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_view_answers")]
+        [InlineKeyboardButton("💬 Дать обратную связь", callback_data=cd.encode("feedback_answer_{int}", user_task_id))],
+        [InlineKeyboardButton("📋 История ответов", callback_data=cd.encode("answer_history_{int}", user_task_id))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_view_answers"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -104,43 +129,58 @@ def answer_moderation_menu(user_task_id):
 def projects_list_keyboard(projects, action_prefix):
     keyboard = []
     for project in projects:
-        keyboard.append([InlineKeyboardButton(project.name, callback_data=f"{action_prefix}_{project.id}")])
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_main")])
+        keyboard.append([InlineKeyboardButton(project.name, callback_data=cd.encode(f"{action_prefix}_{{int}}", project.id))])
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))])
     return InlineKeyboardMarkup(keyboard)
 
-# Меню выбора пользователей
-def users_list_keyboard(users, action_prefix):
+# Кнопки листания страниц списка
+def pagination_buttons(page_prefix, page):
+    buttons = []
+    if page.has_prev and page.first_key is not None:
+        buttons.append(InlineKeyboardButton("⬅️", callback_data=cd.encode(f"{page_prefix}_{{dir}}_{{int}}", "prev", page.first_key)))
+    if page.has_next and page.last_key is not None:
+        buttons.append(InlineKeyboardButton("➡️", callback_data=cd.encode(f"{page_prefix}_{{dir}}_{{int}}", "next", page.last_key)))
+    return buttons
+
+# Меню выбора пользователей (одна страница)
+def users_list_keyboard(page, action_prefix, page_prefix):
     keyboard = []
-    for user in users:
-        keyboard.append([InlineKeyboardButton(f"{user.full_name} (@{user.username})", callback_data=f"{action_prefix}_{user.id}")])
-    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data="cancel_action")])
+    for user in page.rows:
+        keyboard.append([InlineKeyboardButton(f"{user.full_name} (@{user.username})", callback_data=cd.encode(f"{action_prefix}_{{int}}", user.id))])
+    navigation = pagination_buttons(page_prefix, page)
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("cancel_action"))])
     return InlineKeyboardMarkup(keyboard)
 
 # Меню выбора типа рассылки
+@prebuilt
 def broadcast_type_menu():
     keyboard = [
-        [InlineKeyboardButton("📢 Всем пользователям", callback_data="broadcast_all")],
-        [InlineKeyboardButton("📁 По проекту", callback_data="broadcast_project")],
-        [InlineKeyboardButton("👤 Конкретному пользователю", callback_data="broadcast_user")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_main")]
+        [InlineKeyboardButton("📢 Всем пользователям", callback_data=cd.encode("broadcast_all"))],
+        [InlineKeyboardButton("📁 По проекту", callback_data=cd.encode("broadcast_project"))],
+        [InlineKeyboardButton("👤 Конкретному пользователю", callback_data=cd.encode("broadcast_user"))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_main"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню редактирования профиля
+@prebuilt
 def profile_edit_menu():
     keyboard = [
-        [InlineKeyboardButton("✏️ Изменить имя", callback_data="edit_name")],
-        [InlineKeyboardButton("🎯 Изменить статус", callback_data="edit_status")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="user_main")]
+        [InlineKeyboardButton("✏️ Изменить имя", callback_data=cd.encode("edit_name"))],
+        [InlineKeyboardButton("🎯 Изменить статус", callback_data=cd.encode("edit_status"))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("user_main"))]
     ]
     return InlineKeyboardMarkup(keyboard)
 
 # Меню управления заданиями
+@cached
 def task_management_menu(task_id):
     keyboard = [
-        [InlineKeyboardButton("✏️ Изменить задание", callback_data=f"edit_task_{task_id}")],
-        [InlineKeyboardButton("🗑️ Удалить задание", callback_data=f"delete_task_{task_id}")],
-        [InlineKeyboardButton("📊 Посмотреть ответы", callback_data=f"view_task_answers_{task_id}")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="admin_view_answers")]
+        [InlineKeyboardButton("✏️ Изменить задание", callback_data=cd.encode("edit_task_{int}", task_id))],
+        [InlineKeyboardButton("🗑️ Удалить задание", callback_data=cd.encode("delete_task_{int}", task_id))],
+        [InlineKeyboardButton("📊 Посмотреть ответы", callback_data=cd.encode("view_task_answers_{int}", task_id))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=cd.encode("admin_view_answers"))]
     ]
     return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Локальная замена Telegram Bot API для нагрузочных тестов.
+
+Отвечает на методы, которые использует бот (sendMessage, editMessageText,
+answerCallbackQuery, getUpdates, setWebhook и др.) с заданной задержкой,
+случайными 429 и лимитами на чат, как настоящий Telegram. Бот направляется
+сюда через BOT_API_URL:
+
+    python local_bot_api.py --port 8081 --latency 40 --retry-rate 0.01
+    BOT_API_URL=http://127.0.0.1:8081 python app.py
+
+Апдейты для бота кладутся через POST /updates (один апдейт или список в JSON):
+без webhook они отдаются в getUpdates, с webhook - отправляются на его адрес.
+GET /stats возвращает счетчики вызовов и ограничений.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, deque
+import tornado.httpclient
+import tornado.web
+from delivery import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Методы, на которые Telegram накладывает лимиты отправки
+SEND_METHODS = {'sendMessage', 'sendPhoto', 'editMessageText', 'editMessageReplyMarkup'}
+
+class BotApiState:
+    """Состояние сервера: лимиты по чатам, очередь апдейтов, webhook, счетчики"""
+
+    def __init__(self, args):
+        self.latency = args.latency / 1000
+        self.jitter = args.jitter / 1000
+        self.retry_rate = args.retry_rate
+        self.retry_after = args.retry_after
+        self.chat_rate = args.chat_rate
+        self.chat_burst = args.chat_burst
+        self.global_bucket = TokenBucket(args.global_rate, args.global_rate)
+        self.chat_buckets = {}
+        self.blocked_until = {}
+        self.stats = Counter()
+        self.updates = deque()
+        self.update_id = 0
+        self.new_updates = asyncio.Event()
+        self.webhook_url = ''
+        self.message_id = 0
+        self.http = tornado.httpclient.AsyncHTTPClient()
+
+    async def delay(self):
+        latency = self.latency + random.uniform(0, self.jitter)
+        if latency:
+            await asyncio.sleep(latency)
+
+    def flood_wait(self, chat_id):
+        """Сколько секунд чат должен подождать (0 - отправку можно принять)"""
+        now = time.monotonic()
+        if self.retry_rate and random.random() < self.retry_rate:
+            self.stats['429_injected'] += 1
+            return self.retry_after
+
+        blocked_until = self.blocked_until.get(chat_id, 0)
+        if blocked_until > now:
+            # Клиент не дождался retry_after - в Telegram за это можно получить бан
+            self.stats['429_ignored_retry_after'] += 1
+            return blocked_until - now
+
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        wait = max(bucket.delay(), self.global_bucket.delay())
+        if wait:
+            self.stats['429_flood'] += 1
+            self.blocked_until[chat_id] = now + wait
+            return wait
+
+        bucket.consume()
+        self.global_bucket.consume()
+        return 0
+
+    def message(self, params):
+        self.message_id += 1
+        chat_id = params.get('chat_id')
+        return {
+            'message_id': int(params.get('message_id') or self.message_id),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'Local API', 'username': 'local_api_bot'},
+            'text': params.get('text', ''),
+        }
+
+    def add_updates(self, updates):
+        for update in updates:
+            self.update_id += 1
+            update['update_id'] = self.update_id
+            if self.webhook_url:
+                asyncio.create_task(self.push(update))
+            else:
+                self.updates.append(update)
+        self.new_updates.set()
+
+    async def push(self, update):
+        try:
+            await self.http.fetch(
+                self.webhook_url, method='POST', body=json.dumps(update),
+                headers={'Content-Type': 'application/json'}
+            )
+            self.stats['webhook_delivered'] += 1
+        except Exception as e:
+            self.stats['webhook_errors'] += 1
+            logger.error(f"Error delivering update to webhook: {e}")
+
+    async def get_updates(self, offset, timeout, limit):
+        # Подтвержденные апдейты (id меньше offset) больше не отдаем
+        while self.updates and offset and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)[:limit]
+
+class MethodHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def _params(self):
+        if self.request.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(self.request.body or b'{}')
+        return {name: self.get_body_argument(name) for name in self.request.body_arguments}
+
+    def _reply(self, result=None, retry_after=None):
+        if retry_after is not None:
+            retry_after = max(1, math.ceil(retry_after))
+            self.set_status(429)
+            self.write({
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {retry_after}',
+                'parameters': {'retry_after': retry_after}
+            })
+        else:
+            self.write({'ok': True, 'result': result})
+
+    async def post(self, token, method):
+        state = self.state
+        params = self._params()
+        state.stats[method] += 1
+        await state.delay()
+
+        if method in SEND_METHODS:
+            wait = state.flood_wait(params.get('chat_id'))
+            if wait:
+                self._reply(retry_after=wait)
+            else:
+                self._reply(state.message(params))
+        elif method == 'getMe':
+            self._reply({'id': 1, 'is_bot': True, 'first_name': 'Local API', 'username': 'local_api_bot',
+                         'can_join_groups': False, 'can_read_all_group_messages': False,
+                         'supports_inline_queries': False})
+        elif method == 'getUpdates':
+            updates = await state.get_updates(
+                int(params.get('offset') or 0), float(params.get('timeout') or 0), int(params.get('limit') or 100)
+            )
+            self._reply(updates)
+        elif method == 'setWebhook':
+            state.webhook_url = params.get('url', '')
+            if str(params.get('drop_pending_updates')).lower() == 'true':
+                state.updates.clear()
+            self._reply(True)
+        elif method == 'deleteWebhook':
+            state.webhook_url = ''
+            if str(params.get('drop_pending_updates')).lower() == 'true':
+                state.updates.clear()
+            self._reply(True)
+        elif method == 'getWebhookInfo':
+            self._reply({'url': state.webhook_url, 'has_custom_certificate': False,
+                         'pending_update_count': len(state.updates)})
+        else:
+            # answerCallbackQuery, deleteMessage и прочие - просто подтверждаем
+            self._reply(True)
+
+    get = post
+
+class UpdatesHandler(tornado.web.RequestHandler):
+    """Очередь апдейтов для бота от нагрузочного скрипта"""
+
+    def initialize(self, state):
+        self.state = state
+
+    def post(self):
+        updates = json.loads(self.request.body)
+        if isinstance(updates, dict):
+            updates = [updates]
+        self.state.add_updates(updates)
+        self.write({'ok': True, 'count': len(updates)})
+
+class StatsHandler(tornado.web.RequestHandler):
+    def initialize(self, state):
+        self.state = state
+
+    def get(self):
+        self.write(dict(self.state.stats, pending_updates=len(self.state.updates)))
+
+def make_app(state):
+    return tornado.web.Application([
+        (r"/bot([^/]+)/(\w+)", MethodHandler, {'state': state}),
+        (r"/updates", UpdatesHandler, {'state': state}),
+        (r"/stats", StatsHandler, {'state': state}),
+    ])
+
+async def serve(args):
+    state = BotApiState(args)
+    make_app(state).listen(args.port, address=args.host)
+    logger.info(f"Local Bot API listening on http://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=30, help="задержка ответа, мс")
+    parser.add_argument('--jitter', type=float, default=10, help="случайная добавка к задержке, мс")
+    parser.add_argument('--retry-rate', type=float, default=0, help="доля отправок со случайным 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after для случайных 429, с")
+    parser.add_argument('--chat-rate', type=float, default=1, help="сообщений в секунду на чат")
+    parser.add_argument('--chat-burst', type=int, default=3, help="сколько сообщений в чат можно подряд")
+    parser.add_argument('--global-rate', type=float, default=30, help="сообщений в секунду всего")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(serve(args))
+
+if __name__ == '__main__':
+    main()
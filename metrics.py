@@ -0,0 +1,141 @@
+import contextlib
+import functools
+import time
+from collections import Counter
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+import config
+import database
+
+class NullMetric:
+    """Метрика-пустышка: без /metrics prometheus_client не импортируется и ничего не считается"""
+
+    def labels(self, *args):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def set(self, value):
+        pass
+
+    def set_function(self, func):
+        pass
+
+    def time(self):
+        return contextlib.nullcontext()
+
+if config.METRICS_ENABLED:
+    from prometheus_client import Counter as PromCounter, Histogram, Gauge, CollectorRegistry
+
+    # Отдельный реестр: в /metrics только метрики бота
+    registry = CollectorRegistry()
+
+    UPDATES = PromCounter('bot_updates_total', 'Processed updates', ['type'], registry=registry)
+    UPDATE_SECONDS = Histogram('bot_update_seconds', 'Update processing time', ['type'], registry=registry)
+    HANDLER_SECONDS = Histogram('bot_handler_seconds', 'Handler callback latency', ['handler'], registry=registry)
+    CALLBACK_SECONDS = Histogram('bot_callback_route_seconds', 'Callback route latency', ['router', 'route'], registry=registry)
+    CALLBACK_MISSES = PromCounter('bot_callback_misses_total', 'Callbacks without a route', ['router'], registry=registry)
+    DB_QUERIES = PromCounter('bot_db_queries_total', 'SQL statements executed', registry=registry)
+    DB_QUERY_SECONDS = Histogram(
+        'bot_db_query_seconds', 'SQL statement duration',
+        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+        registry=registry
+    )
+    SENDS = PromCounter('bot_send_total', 'Outgoing Bot API sends by result', ['result'], registry=registry)
+    DEAD_LETTERS = Gauge('bot_dead_letters', 'Undelivered messages kept in memory since start', registry=registry)
+    BOT_API_REQUESTS = PromCounter('bot_api_requests_total', 'Bot API requests by method and HTTP status', ['method', 'status'], registry=registry)
+    UPDATE_DB_QUERIES = Histogram(
+        'bot_update_db_queries', 'SQL statements per update', ['type'],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34), registry=registry
+    )
+    UPDATE_QUEUE_DEPTH = Gauge('bot_update_queue_depth', 'Queued and in-flight updates', registry=registry)
+    STARTUP_SECONDS = Gauge('bot_startup_seconds', 'Cold start duration by phase (from process start)', ['phase'], registry=registry)
+
+    def _observe_query(statement, parameters, seconds):
+        DB_QUERIES.inc()
+        DB_QUERY_SECONDS.observe(seconds)
+
+    database.query_listeners.append(_observe_query)
+else:
+    registry = None
+    UPDATES = UPDATE_SECONDS = HANDLER_SECONDS = CALLBACK_SECONDS = CALLBACK_MISSES = NullMetric()
+    DB_QUERIES = DB_QUERY_SECONDS = SENDS = DEAD_LETTERS = BOT_API_REQUESTS = NullMetric()
+    UPDATE_DB_QUERIES = UPDATE_QUEUE_DEPTH = STARTUP_SECONDS = NullMetric()
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest со счетчиком ответов Bot API (в том числе 429) по методу"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            BOT_API_REQUESTS.labels(api_method, 'error').inc()
+            raise
+        BOT_API_REQUESTS.labels(api_method, str(code)).inc()
+        return code, payload
+
+def update_type(update):
+    """Тип апдейта для меток: message, callback_query, ..."""
+    for kind in ('callback_query', 'message', 'edited_message', 'my_chat_member'):
+        if getattr(update, kind, None) is not None:
+            return kind
+    return 'other'
+
+def _timed(callback, name):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
+    wrapper.instrumented = True
+    return wrapper
+
+def instrument_handlers(application):
+    """Оборачивает callback всех зарегистрированных обработчиков замером времени"""
+    handlers = [handler for group in application.handlers.values() for handler in group]
+    while handlers:
+        handler = handlers.pop()
+        if isinstance(handler, ConversationHandler):
+            handlers.extend(handler.entry_points)
+            handlers.extend(h for state_handlers in handler.states.values() for h in state_handlers)
+            handlers.extend(handler.fallbacks)
+        elif not getattr(handler.callback, 'instrumented', False):
+            handler.callback = _timed(handler.callback, handler.callback.__qualname__)
+
+class ConversationStates:
+    """Сколько пользователей сейчас в каждом шаге диалогов (считается при опросе /metrics)"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+        metric = GaugeMetricFamily('bot_conversation_states', 'Users per conversation state', labels=['flow', 'state'])
+        states = Counter(
+            data.get('state') for data in self.application.user_data.values() if data.get('state')
+        )
+        for state, count in states.items():
+            metric.add_metric(['user_data', str(state)], count)
+
+        persistence = self.application.persistence
+        for name, conversations in getattr(persistence, 'conversations', {}).items():
+            for state, count in Counter(conversations.values()).items():
+                metric.add_metric([name, str(state)], count)
+        yield metric
+
+def register_application(application, update_queue):
+    if registry is None:
+        return
+    registry.register(ConversationStates(application))
+    UPDATE_QUEUE_DEPTH.set_function(lambda: update_queue.unfinished)
+
+def render():
+    from prometheus_client import generate_latest
+    return generate_latest(registry)
@@ -0,0 +1,14 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+import repository as repo
+
+async def resolve_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик группы -1: находит пользователя апдейта один раз, до остальных обработчиков"""
+    if update.effective_user:
+        context.db_user = await repo.get_user_by_telegram_id(update.effective_user.id)
+
+async def current_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Пользователь апдейта (None, если не зарегистрирован)"""
+    if 'db_user' not in vars(context):
+        await resolve_user(update, context)
+    return getattr(context, 'db_user', None)
@@ -0,0 +1,121 @@
+from datetime import datetime
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import keyboards as kb
+import callback_codec as cd
+
+# Тексты уведомлений: каждая функция возвращает (текст, клавиатура или None)
+
+def new_answer(project, task, user, user_task):
+    message = f"🎯 Новый ответ на задание!\n\n"
+    message += f"📂 Проект: {project.name}\n"
+    message += f"📝 Задание: {task.title}\n"
+    message += f"👤 Пользователь: {user.full_name} (@{user.username})\n"
+    message += f"⏰ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📋 Посмотреть ответ", callback_data=cd.encode("view_answer_{int}", user_task.id))]
+    ])
+    return message, keyboard
+
+def clarification(project, task, user, question):
+    message = f"❓ Вопрос по заданию!\n\n"
+    message += f"📂 Проект: {project.name}\n"
+    message += f"📝 Задание: {task.title}\n"
+    message += f"👤 Пользователь: {user.full_name} (@{user.username})\n"
+    message += f"❓ Вопрос: {question}\n"
+    message += f"⏰ Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("💬 Ответить", callback_data=cd.encode("answer_clarification_{int}_{int}", user.id, task.id))]
+    ])
+    return message, keyboard
+
+# Сводка админу: длина текста с запасом до лимита Telegram (4096)
+DIGEST_TEXT_LIMIT = 3500
+
+def digest_answer_line(user):
+    return user.full_name
+
+def digest_clarification_line(user, question):
+    if len(question) > 200:
+        question = question[:200] + "…"
+    return f"{user.full_name}: {question}"
+
+def admin_digest(events):
+    """Сводка по событиям [(тип, строка, задание, проект)], сгруппированная по проектам и заданиям"""
+    answers = sum(1 for message_type, *_ in events if message_type == 'answer')
+    questions = len(events) - answers
+    message = f"📬 Сводка: новых ответов - {answers}, вопросов - {questions}\n"
+
+    grouped = {}
+    for message_type, line, task, project in events:
+        tasks = grouped.setdefault(project.id, (project, {}))[1]
+        tasks.setdefault(task.id, (task, []))[1].append((message_type, line))
+
+    for project, tasks in grouped.values():
+        message += f"\n📂 {project.name}\n"
+        for task, items in tasks.values():
+            message += f"📝 {task.title}\n"
+            names = [line for message_type, line in items if message_type == 'answer']
+            if names:
+                message += f"   🎯 Ответы ({len(names)}): {', '.join(dict.fromkeys(names))}\n"
+            for message_type, line in items:
+                if message_type == 'clarification':
+                    message += f"   ❓ {line}\n"
+
+    if len(message) > DIGEST_TEXT_LIMIT:
+        message = message[:DIGEST_TEXT_LIMIT].rsplit('\n', 1)[0] + "\n…"
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("📊 Ответы на проверке", callback_data=cd.encode("admin_view_answers"))]
+    ])
+    return message, keyboard
+
+def new_task(project, task):
+    message = f"🎯 Новое задание!\n\n"
+    message += f"📂 Проект: {project.name}\n"
+    message += f"📝 {task.title}\n"
+    message += f"📄 {task.description}\n"
+    if task.deadline:
+        message += f"⏰ Дедлайн: {task.deadline.strftime('%d.%m.%Y %H:%M')}\n"
+
+    keyboard = InlineKeyboardMarkup([[
+        InlineKeyboardButton("📋 Перейти к заданию", callback_data=cd.encode("task_detail_{int}", task.id))
+    ]])
+    return message, keyboard
+
+def answer_reviewed(task, status, feedback=None):
+    if feedback:
+        message = f"💬 Получена обратная связь!\n\n"
+        message += f"📝 Задание: {task.title}\n"
+        message += f"💬 Комментарий: {feedback}\n\n"
+        message += "🔄 Пожалуйста, переделайте задание с учетом комментариев."
+        return message, kb.back_button("my_tasks")
+    if status == 'approved':
+        return f"🎉 Ваш ответ на задание '{task.title}' был утвержден!", None
+    return (
+        f"❌ Ваш ответ на задание '{task.title}' был отклонен.\n\n"
+        "Пожалуйста, пересмотрите задание и отправьте ответ заново."
+    ), None
+
+def deadline_reminder(project, tasks, hours):
+    message = f"⏰ Напоминание о дедлайне!\n\n"
+    message += f"📂 Проект: {project.name}\n"
+    message += f"⌛ Осталось меньше {hours:g} ч.\n\n"
+    for task in tasks:
+        message += f"📝 {task.title}\n"
+        message += f"   ⏰ До {task.deadline.strftime('%d.%m.%Y %H:%M')}\n"
+
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"📋 {task.title}", callback_data=cd.encode("task_detail_{int}", task.id))]
+        for task in tasks
+    ])
+    return message, keyboard
+
+def role_changed(role):
+    if role == 'admin':
+        return (
+            "🎉 Вам были предоставлены права администратора!\n\n"
+            "Используйте команду /admin для доступа к админ-панели."
+        ), None
+    return "ℹ️ Ваши права администратора были отозваны.", None
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from telegram import InlineKeyboardMarkup
+from database import Session, run_db, Notification, User, Task, Project
+from delivery import SENT, REJECTED
+import notifications
+import config
+
+logger = logging.getLogger(__name__)
+
+# Будит воркер сразу после коммита, не дожидаясь очередного опроса
+_wakeup = asyncio.Event()
+_loop = None
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('outbox_pending', False) and _loop is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+def enqueue(session, user_id, notification, message_type='info', task_id=None):
+    """Добавляет уведомление (текст, клавиатура) в outbox в рамках текущей транзакции"""
+    message, reply_markup = notification
+    session.info['outbox_pending'] = True
+    session.add(Notification(
+        user_id=user_id,
+        task_id=task_id,
+        message=message,
+        message_type=message_type,
+        reply_markup=reply_markup.to_dict() if reply_markup else None,
+        status='pending'
+    ))
+
+def hold_for_digest(session, user_id, line, message_type, task_id):
+    """Откладывает событие для сводки админу; в очередь отправки его переносит flush_digests"""
+    session.add(Notification(
+        user_id=user_id,
+        task_id=task_id,
+        message=line,
+        message_type=message_type,
+        status='digest'
+    ))
+
+def flush_digests(session, user_ids=None, ready_before=None):
+    """Собирает отложенные события каждого админа в одно уведомление; возвращает число сводок.
+
+    ready_before - отправлять только тем, у кого самое старое событие не новее этого времени.
+    """
+    query = session.query(Notification, Task, Project).join(
+        Task, Task.id == Notification.task_id
+    ).join(
+        Project, Project.id == Task.project_id
+    ).filter(Notification.status == 'digest')
+    if user_ids is not None:
+        query = query.filter(Notification.user_id.in_(user_ids))
+
+    events = {}
+    for notification, task, project in query.order_by(Notification.id):
+        events.setdefault(notification.user_id, []).append((notification, task, project))
+
+    count = 0
+    for user_id, user_events in events.items():
+        if ready_before is not None and user_events[0][0].created_at > ready_before:
+            continue
+        digest = notifications.admin_digest([
+            (notification.message_type, notification.message, task, project)
+            for notification, task, project in user_events
+        ])
+        enqueue(session, user_id, digest, message_type='digest')
+        for notification, _, _ in user_events:
+            notification.status = 'digested'
+        count += 1
+    return count
+
+def claim_batch(session, limit):
+    """Забирает пачку уведомлений на отправку, включая зависшие после перезапуска"""
+    now = datetime.now()
+    stale = now - timedelta(seconds=config.OUTBOX_LEASE_SECONDS)
+    retry_after = now - timedelta(seconds=config.OUTBOX_RETRY_DELAY)
+    rows = session.query(Notification, User.user_id).join(User, User.id == Notification.user_id).filter(
+        ((Notification.status == 'pending') &
+         ((Notification.claimed_at == None) | (Notification.claimed_at < retry_after))) |
+        ((Notification.status == 'sending') & (Notification.claimed_at < stale))
+    ).order_by(Notification.id).limit(limit).all()
+
+    batch = []
+    for notification, chat_id in rows:
+        notification.status = 'sending'
+        notification.claimed_at = now
+        notification.attempts = (notification.attempts or 0) + 1
+        batch.append({
+            'id': notification.id,
+            'chat_id': chat_id,
+            'text': notification.message,
+            'reply_markup': notification.reply_markup,
+            'attempts': notification.attempts
+        })
+    return batch
+
+def finish_batch(session, delivered_ids, failed):
+    """Отмечает доставленные; недоставленные возвращает в очередь или помечает failed
+    (сразу, если Telegram отклонил сообщение насовсем)"""
+    now = datetime.now()
+    if delivered_ids:
+        session.query(Notification).filter(Notification.id.in_(delivered_ids)).update(
+            {'status': 'delivered', 'delivered_at': now}, synchronize_session=False
+        )
+    retry_ids, dead_ids = [], []
+    for item in failed:
+        if item.get('rejected') or item['attempts'] >= config.OUTBOX_MAX_ATTEMPTS:
+            dead_ids.append(item['id'])
+        else:
+            retry_ids.append(item['id'])
+    if retry_ids:
+        session.query(Notification).filter(Notification.id.in_(retry_ids)).update(
+            {'status': 'pending'}, synchronize_session=False
+        )
+    if dead_ids:
+        session.query(Notification).filter(Notification.id.in_(dead_ids)).update(
+            {'status': 'failed'}, synchronize_session=False
+        )
+
+class OutboxWorker:
+    """Фоновая доставка уведомлений из таблицы notifications"""
+
+    def __init__(self, bot, delivery):
+        self.bot = bot
+        self.delivery = delivery
+        self.task = None
+        self.stopping = False
+
+    def start(self):
+        global _loop
+        _loop = asyncio.get_running_loop()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Дает текущей пачке доотправиться (до OUTBOX_STOP_TIMEOUT), новых не берет.
+        Вызывать, пока HTTP-клиент бота еще открыт"""
+        if not self.task:
+            return
+        self.stopping = True
+        _wakeup.set()
+        try:
+            await asyncio.wait_for(self.task, timeout=config.OUTBOX_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Outbox batch did not finish before shutdown")
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def run(self):
+        while not self.stopping:
+            _wakeup.clear()
+            try:
+                batch = await run_db(claim_batch, config.OUTBOX_BATCH_SIZE)
+                if batch:
+                    await self.deliver(batch)
+                    continue
+            except Exception as e:
+                logger.error(f"Error delivering notifications: {e}")
+
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=config.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def deliver(self, batch):
+        delivered_ids = []
+        failed = []
+
+        async def deliver_one(item):
+            reply_markup = None
+            if item['reply_markup']:
+                reply_markup = InlineKeyboardMarkup.de_json(item['reply_markup'], self.bot)
+            result = await self.delivery.send(item['chat_id'], item['text'], reply_markup=reply_markup)
+            if result == SENT:
+                delivered_ids.append(item['id'])
+            else:
+                failed.append(dict(item, rejected=result == REJECTED))
+
+        try:
+            await asyncio.gather(*(deliver_one(item) for item in batch))
+        finally:
+            # Фиксируем результат даже при остановке бота, чтобы не отправить повторно
+            await asyncio.shield(run_db(finish_batch, delivered_ids, failed))
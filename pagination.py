@@ -0,0 +1,29 @@
+from collections import namedtuple
+import config
+
+# Страница списка: строки и ключи первой/последней строки для кнопок "назад/вперед"
+Page = namedtuple('Page', ['rows', 'has_prev', 'has_next', 'first_key', 'last_key'])
+
+def keyset_page(query, key_column, key_of, cursor=None, direction='next', limit=None, descending=False):
+    """Загружает одну страницу по ключу (keyset): WHERE key > cursor ORDER BY key LIMIT n + 1"""
+    limit = limit or config.PAGE_SIZE
+    # При листании назад идем в обратном порядке и потом разворачиваем строки
+    backwards = direction == 'prev'
+    reverse_order = descending != backwards
+
+    if cursor is not None:
+        query = query.filter(key_column < cursor if reverse_order else key_column > cursor)
+    query = query.order_by(key_column.desc() if reverse_order else key_column.asc())
+    rows = query.limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = cursor is not None, has_more
+
+    first_key = key_of(rows[0]) if rows else None
+    last_key = key_of(rows[-1]) if rows else None
+    return Page(rows, has_prev, has_next, first_key, last_key)
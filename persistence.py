@@ -0,0 +1,131 @@
+import asyncio
+import copy
+import json
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+import repository as repo
+import config
+
+logger = logging.getLogger(__name__)
+
+class SQLPersistence(BasePersistence):
+    """Хранит user_data, bot_data и состояния диалогов в таблице bot_state.
+
+    PTB вызывает update_* раз в update_interval секунд только для изменившихся
+    пользователей; здесь изменения копятся в буфере и пишутся одной транзакцией.
+    """
+
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=False, user_data=True, callback_data=False),
+            update_interval=config.PERSISTENCE_INTERVAL
+        )
+        self.state = None
+        # Последние записанные значения - неизменившиеся данные не пишем повторно
+        self.saved = {}
+        self.dirty = {}
+        self.writer = None
+        # Текущие состояния диалогов {имя: {ключ: состояние}} - для метрик
+        self.conversations = {}
+
+    async def _load(self):
+        if self.state is None:
+            self.state = await repo.load_bot_state()
+            for kind, items in self.state.items():
+                for key, data in items.items():
+                    # Копия: сами словари PTB получит как живые user_data/bot_data и будет менять
+                    self.saved[(kind, key)] = copy.deepcopy(data)
+        return self.state
+
+    def _mark(self, kind, key, data):
+        data = copy.deepcopy(data) if data is not None else None
+        if self.saved.get((kind, key)) == data and (kind, key) not in self.dirty:
+            return
+        self.dirty[(kind, key)] = data
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        try:
+            while self.dirty:
+                batch, self.dirty = self.dirty, {}
+                try:
+                    await repo.save_bot_state(batch)
+                except Exception as e:
+                    logger.error(f"Error saving bot state: {e}")
+                    # Вернем в буфер то, что не перезаписали за время попытки
+                    for key, data in batch.items():
+                        self.dirty.setdefault(key, data)
+                    break
+                self.saved.update(batch)
+        finally:
+            self.writer = None
+
+    # Загрузка при старте
+
+    async def get_user_data(self):
+        state = await self._load()
+        return {int(key): data or {} for key, data in state.get('user', {}).items()}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        state = await self._load()
+        return state.get('bot', {}).get('bot') or {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        state = await self._load()
+        conversations = {
+            tuple(json.loads(key)): data
+            for key, data in state.get(f'conversation:{name}', {}).items()
+        }
+        self.conversations[name] = dict(conversations)
+        return conversations
+
+    # Изменения
+
+    async def update_user_data(self, user_id, data):
+        self._mark('user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        self._mark('bot', 'bot', data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        conversations = self.conversations.setdefault(name, {})
+        if new_state is None:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = new_state
+        self._mark(f'conversation:{name}', json.dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id):
+        self._mark('user', str(user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Дописывает буфер при остановке бота"""
+        if self.writer is not None:
+            await self.writer
+        if self.dirty:
+            await self._write_pending()
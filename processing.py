@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from telegram.ext import BaseUpdateProcessor
+import callback_codec as cd
+import config
+import metrics
+from database import QueryStats, update_query_stats
+
+logger = logging.getLogger(__name__)
+
+class BoundedUpdateQueue(asyncio.Queue):
+    """Очередь апдейтов с ограничением на число необработанных (в очереди + в работе).
+
+    Application вызывает task_done только после обработки апдейта, поэтому при
+    заполнении put ждет: webhook дольше отвечает Telegram, polling не тянет новые.
+    """
+
+    def __init__(self, limit):
+        super().__init__()
+        self.slots = asyncio.Semaphore(limit)
+        self.unfinished = 0
+
+    async def put(self, item):
+        await self.slots.acquire()
+        self.unfinished += 1
+        await super().put(item)
+
+    def task_done(self):
+        super().task_done()
+        self.unfinished -= 1
+        self.slots.release()
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов разных пользователей.
+
+    Апдейты одного пользователя (или чата) выполняются строго по очереди, чтобы
+    шаги диалогов по context.user_data['state'] не обгоняли друг друга.
+    """
+
+    def __init__(self, concurrency, queue_limit):
+        # Внешний семафор BaseUpdateProcessor не должен тормозить апдейты до
+        # захвата очереди пользователя, иначе ждущие апдейты одного пользователя
+        # займут все слоты. Реальный лимит - self.running
+        super().__init__(max(queue_limit, concurrency))
+        self.running = asyncio.Semaphore(concurrency)
+        self.locks = {}
+
+    @staticmethod
+    def _order_key(update):
+        user = getattr(update, 'effective_user', None)
+        if user:
+            return 'user', user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat:
+            return 'chat', chat.id
+        return None
+
+    @staticmethod
+    def _describe(update):
+        """Короткое описание апдейта для лога: маршрут callback'а или команда"""
+        query = getattr(update, 'callback_query', None)
+        if query is not None and query.data:
+            decoded = cd.decode(query.data) if cd.is_encoded(query.data) else None
+            return f"callback {decoded[0] if decoded else query.data}"
+        message = getattr(update, 'message', None)
+        if message is not None and message.text and message.text.startswith('/'):
+            return f"command {message.text.split()[0]}"
+        return metrics.update_type(update)
+
+    async def do_process_update(self, update, coroutine):
+        kind = metrics.update_type(update)
+        metrics.UPDATES.labels(kind).inc()
+        stats = QueryStats()
+        token = update_query_stats.set(stats)
+        try:
+            with metrics.UPDATE_SECONDS.labels(kind).time():
+                await self._process_in_order(update, coroutine)
+        finally:
+            update_query_stats.reset(token)
+            metrics.UPDATE_DB_QUERIES.labels(kind).observe(stats.count)
+            if stats.count > config.UPDATE_QUERY_BUDGET or stats.seconds * 1000 > config.UPDATE_DB_BUDGET_MS:
+                logger.warning(
+                    f"Update over DB budget ({self._describe(update)}): "
+                    f"{stats.count} queries, {stats.seconds * 1000:.0f} ms"
+                )
+
+    async def _process_in_order(self, update, coroutine):
+        key = self._order_key(update)
+        if key is None:
+            async with self.running:
+                await coroutine
+            return
+
+        # [lock, число апдейтов пользователя в работе] - удаляем, когда никого не осталось
+        entry = self.locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self.running:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def build_update_processing():
+    """(очередь, обработчик) для ApplicationBuilder по настройкам из config"""
+    return (
+        BoundedUpdateQueue(config.UPDATE_QUEUE_SIZE),
+        OrderedUpdateProcessor(config.UPDATE_CONCURRENCY, config.UPDATE_QUEUE_SIZE)
+    )
@@ -0,0 +1,29 @@
+import logging
+from datetime import datetime, timedelta
+import repository as repo
+import config
+
+logger = logging.getLogger(__name__)
+
+class DeadlineReminders:
+    """Периодически ставит в outbox напоминания о приближающихся дедлайнах"""
+
+    def __init__(self):
+        # После перезапуска догоняем пропущенное окно; повторы отсекает таблица task_reminders
+        self.last_tick = datetime.now() - timedelta(seconds=config.REMINDER_LOOKBACK)
+
+    def schedule(self, job_queue):
+        if job_queue is None:
+            logger.warning("JobQueue is not available, deadline reminders are disabled")
+            return
+        job_queue.run_repeating(self.tick, interval=config.REMINDER_INTERVAL, first=10, name='deadline_reminders')
+
+    async def tick(self, context):
+        now = datetime.now()
+        try:
+            count = await repo.enqueue_deadline_reminders(self.last_tick, now, config.REMINDER_OFFSETS)
+            self.last_tick = now
+            if count:
+                logger.info(f"Queued {count} deadline reminders")
+        except Exception as e:
+            logger.error(f"Error queueing deadline reminders: {e}")
@@ -0,0 +1,579 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import case, event, func, text
+from sqlalchemy.exc import IntegrityError
+import config
+from database import Session, run_db, unit_of_work, BotState, User, Project, Task, TaskAssignment, UserTask, UserProject, Notification, TaskReminder, AdminAction
+from pagination import keyset_page
+import notifications
+import outbox
+
+def db_call(func):
+    """Превращает синхронную функцию func(session, ...) в корутину, выполняемую в пуле потоков БД"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+# Кэш списка админов: сбрасывается после коммита, изменившего роли.
+# generation растет при каждом сбросе: загрузка, начатая до сброса, не попадет в кэш
+_admin_roster = {'ids': None, 'loaded_at': 0, 'generation': 0}
+_admin_roster_lock = threading.Lock()
+
+def _admin_ids(session):
+    """Возвращает User.id всех админов, читая БД только при пустом или устаревшем кэше"""
+    with _admin_roster_lock:
+        ids = _admin_roster['ids']
+        if ids is not None and time.monotonic() - _admin_roster['loaded_at'] < config.ADMIN_ROSTER_TTL:
+            return ids
+        generation = _admin_roster['generation']
+    ids = tuple(user_id for (user_id,) in session.query(User.id).filter(User.role == 'admin').all())
+    with _admin_roster_lock:
+        if generation == _admin_roster['generation']:
+            _admin_roster['ids'] = ids
+            _admin_roster['loaded_at'] = time.monotonic()
+    return ids
+
+def _roles_changed(session):
+    session.info['admin_roster_dirty'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _reset_admin_roster(session):
+    if session.info.pop('admin_roster_dirty', False):
+        with _admin_roster_lock:
+            _admin_roster['generation'] += 1
+            _admin_roster['ids'] = None
+
+# Кэш пользователей по Telegram ID: {telegram_id: (user, время загрузки)}, старые вытесняются.
+# Сбрасывается после коммита, изменившего роль, имя или статус пользователя
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+# Растет при каждом сбросе: загрузка, начатая до сброса, не попадет в кэш
+_user_cache_generation = [0]
+
+def _cached_user(telegram_id):
+    with _user_cache_lock:
+        entry = _user_cache.get(telegram_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] >= config.USER_CACHE_TTL:
+            del _user_cache[telegram_id]
+            return None
+        _user_cache.move_to_end(telegram_id)
+        return entry[0]
+
+def _users_changed(session, *telegram_ids):
+    session.info.setdefault('changed_users', set()).update(telegram_ids)
+
+@event.listens_for(Session, 'after_commit')
+def _reset_user_cache(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        with _user_cache_lock:
+            _user_cache_generation[0] += 1
+            for telegram_id in changed:
+                _user_cache.pop(telegram_id, None)
+
+def _load_user(session, telegram_id):
+    generation = _user_cache_generation[0]
+    user = session.query(User).filter(User.user_id == telegram_id).first()
+    if user is not None:
+        with _user_cache_lock:
+            if generation == _user_cache_generation[0]:
+                _user_cache[telegram_id] = (user, time.monotonic())
+                _user_cache.move_to_end(telegram_id)
+                while len(_user_cache) > config.USER_CACHE_SIZE:
+                    _user_cache.popitem(last=False)
+    return user
+
+# Пользователи
+
+async def get_user_by_telegram_id(telegram_id):
+    """Пользователь по Telegram ID; из кэша без обращения к пулу БД, если он там есть"""
+    user = _cached_user(telegram_id)
+    if user is not None:
+        return user
+    return await run_db(_load_user, telegram_id)
+
+@db_call
+def get_user_by_id(session, user_id):
+    return session.query(User).filter(User.id == user_id).first()
+
+@db_call
+def get_user_by_username(session, username):
+    return session.query(User).filter(User.username == username).first()
+
+@db_call
+def get_users_by_ids(session, user_ids):
+    if not user_ids:
+        return []
+    return session.query(User).filter(User.id.in_(user_ids)).all()
+
+@db_call
+def get_users_page(session, cursor=None, direction='next'):
+    return keyset_page(session.query(User), User.id, lambda user: user.id, cursor, direction)
+
+@db_call
+def get_admins_page(session, cursor=None, direction='next'):
+    query = session.query(User).filter(User.role == 'admin')
+    return keyset_page(query, User.id, lambda user: user.id, cursor, direction)
+
+@db_call
+def create_user(session, user_data):
+    user = User(**user_data)
+    session.add(user)
+    session.flush()
+    _users_changed(session, user.user_id)
+    return user
+
+@db_call
+def grant_admin(session, user_data):
+    """Делает пользователя админом, создавая его при необходимости"""
+    user = session.query(User).filter(User.user_id == user_data['user_id']).first()
+    if user:
+        user.role = 'admin'
+    else:
+        user = User(role='admin', **user_data)
+        session.add(user)
+    session.flush()
+    _roles_changed(session)
+    _users_changed(session, user.user_id)
+    return user
+
+@db_call
+def set_user_role(session, user_id, role):
+    user = session.query(User).filter(User.id == user_id).first()
+    if user:
+        user.role = role
+        _roles_changed(session)
+        _users_changed(session, user.user_id)
+        outbox.enqueue(session, user.id, notifications.role_changed(role))
+    return user
+
+@db_call
+def update_user_profile(session, telegram_id, **fields):
+    user = session.query(User).filter(User.user_id == telegram_id).first()
+    if user:
+        for key, value in fields.items():
+            setattr(user, key, value)
+        _users_changed(session, telegram_id)
+    return user
+
+@db_call
+def get_user_stats(session, user_id):
+    """Возвращает (проектов, ответов, принятых ответов) пользователя одним запросом"""
+    projects_count = session.query(func.count(UserProject.id)).filter(
+        UserProject.user_id == user_id
+    ).scalar_subquery()
+    answers = session.query(
+        func.count(UserTask.id),
+        func.coalesce(func.sum(case((UserTask.status == 'approved', 1), else_=0)), 0),
+        projects_count
+    ).filter(UserTask.user_id == user_id).one()
+    tasks_count, approved_count, projects = answers
+    return projects, tasks_count, approved_count
+
+@db_call
+def get_user_projects(session, telegram_id):
+    user = session.query(User).filter(User.user_id == telegram_id).first()
+    if not user:
+        return []
+
+    return session.query(Project).join(UserProject).filter(
+        UserProject.user_id == user.id,
+        Project.is_archived == False
+    ).all()
+
+# Проекты
+
+@db_call
+def get_project(session, project_id):
+    return session.query(Project).filter(Project.id == project_id).first()
+
+@db_call
+def get_projects(session, archived=False):
+    return session.query(Project).filter(Project.is_archived == archived).all()
+
+def _project_stats_query(session):
+    """Проекты со статистикой (участников, активных заданий, ответов на проверке) одним запросом"""
+    participants = session.query(
+        UserProject.project_id, func.count(UserProject.id).label('count')
+    ).group_by(UserProject.project_id).subquery()
+    active_tasks = session.query(
+        Task.project_id, func.count(Task.id).label('count')
+    ).filter(Task.is_active == True).group_by(Task.project_id).subquery()
+    pending_answers = session.query(
+        Task.project_id, func.count(UserTask.id).label('count')
+    ).join(UserTask, UserTask.task_id == Task.id).filter(
+        UserTask.status == 'pending'
+    ).group_by(Task.project_id).subquery()
+
+    return session.query(
+        Project,
+        func.coalesce(participants.c.count, 0),
+        func.coalesce(active_tasks.c.count, 0),
+        func.coalesce(pending_answers.c.count, 0)
+    ).outerjoin(
+        participants, participants.c.project_id == Project.id
+    ).outerjoin(
+        active_tasks, active_tasks.c.project_id == Project.id
+    ).outerjoin(
+        pending_answers, pending_answers.c.project_id == Project.id
+    )
+
+@db_call
+def get_projects_overview(session, archived=False, cursor=None, direction='next'):
+    """Возвращает страницу строк (проект, участников, активных заданий, ответов на проверке)"""
+    query = _project_stats_query(session).filter(Project.is_archived == archived)
+    return keyset_page(query, Project.id, lambda row: row[0].id, cursor, direction)
+
+@db_call
+def get_project_overview(session, project_id):
+    """Возвращает (проект, участников, активных заданий, ответов на проверке) или None"""
+    return _project_stats_query(session).filter(Project.id == project_id).first()
+
+@db_call
+def create_project(session, created_by, name, description, board_link=None):
+    project = Project(
+        name=name,
+        description=description,
+        board_link=board_link,
+        created_by=created_by
+    )
+    session.add(project)
+    session.flush()
+    return project
+
+@db_call
+def archive_project(session, project_id):
+    project = session.query(Project).filter(Project.id == project_id).first()
+    if project:
+        project.is_archived = True
+    return project
+
+@db_call
+def get_project_member_ids(session, project_id):
+    project_users = session.query(UserProject).filter(UserProject.project_id == project_id).all()
+    return [up.user_id for up in project_users]
+
+@db_call
+def get_broadcast_recipients(session, broadcast_data):
+    if broadcast_data['type'] == 'all':
+        return session.query(User).all()
+    elif broadcast_data['type'] == 'project':
+        project_users = session.query(UserProject).filter(
+            UserProject.project_id == broadcast_data['project_id']
+        ).all()
+        user_ids = [up.user_id for up in project_users]
+        return session.query(User).filter(User.id.in_(user_ids)).all()
+    elif broadcast_data['type'] == 'user':
+        user = session.query(User).filter(User.id == broadcast_data['user_id']).first()
+        return [user] if user else []
+    return []
+
+# Задания
+
+@db_call
+def get_task(session, task_id):
+    return session.query(Task).filter(Task.id == task_id).first()
+
+@db_call
+def resolve_task_targets(session, project_id, target_text):
+    """Возвращает список User.id, кому назначается задание"""
+    if target_text.lower() == 'всем':
+        # Назначаем всем участникам проекта
+        project_users = session.query(UserProject).filter(UserProject.project_id == project_id).all()
+        return [up.user_id for up in project_users]
+
+    # Пользователи по username, только участники проекта - одним запросом
+    usernames = [username.strip('@') for username in target_text.split() if username.startswith('@')]
+    if not usernames:
+        return []
+    users = session.query(User.id).join(
+        UserProject, (UserProject.user_id == User.id) & (UserProject.project_id == project_id)
+    ).filter(User.username.in_(usernames)).all()
+    return [user_id for user_id, in users]
+
+@db_call
+def create_task(session, created_by, project_id, title, description, deadline, target_users):
+    """Создает задание и ставит уведомления назначенным пользователям"""
+    target_users = list(dict.fromkeys(target_users))
+    task = Task(
+        project_id=project_id,
+        title=title,
+        description=description,
+        deadline=deadline,
+        created_by=created_by,
+        # Пишем и в старую колонку: для переноса NULL значит "все участники проекта"
+        target_users=target_users
+    )
+    session.add(task)
+    session.flush()
+    session.add_all(TaskAssignment(task_id=task.id, user_id=user_id) for user_id in target_users)
+
+    project = session.query(Project).filter(Project.id == project_id).first()
+    notification = notifications.new_task(project, task)
+    for user_id in target_users:
+        outbox.enqueue(session, user_id, notification, task_id=task.id)
+    return task
+
+@db_call
+def get_user_tasks_overview(session, user_id, cursor=None, direction='next'):
+    """Возвращает None, если пользователь не в проектах, иначе страницу (задание, проект, ответ или None)"""
+    # Один запрос: активные задания, назначенные пользователю + проект + ответ пользователя
+    query = session.query(Task, Project, UserTask).join(
+        TaskAssignment, (TaskAssignment.task_id == Task.id) & (TaskAssignment.user_id == user_id)
+    ).join(
+        Project, Project.id == Task.project_id
+    ).outerjoin(
+        UserTask, (UserTask.task_id == Task.id) & (UserTask.user_id == user_id)
+    ).filter(
+        Task.is_active == True
+    )
+    page = keyset_page(query, Task.id, lambda row: row[0].id, cursor, direction)
+
+    if not page.rows and cursor is None:
+        # Пустой список: отличаем "нет проектов" от "нет заданий"
+        if not session.query(UserProject.id).filter(UserProject.user_id == user_id).first():
+            return None
+    return page
+
+@db_call
+def get_task_detail(session, task_id, user_id):
+    """Возвращает (задание, проект, ответ пользователя) или None"""
+    return session.query(Task, Project, UserTask).join(
+        Project, Project.id == Task.project_id
+    ).outerjoin(
+        UserTask, (UserTask.task_id == Task.id) & (UserTask.user_id == user_id)
+    ).filter(
+        Task.id == task_id
+    ).first()
+
+@db_call
+def enqueue_deadline_reminders(session, since, until, offsets):
+    """Ставит в outbox напоминания, срок которых наступил в (since, until]; возвращает их число"""
+    count = 0
+    for hours in offsets:
+        offset = timedelta(hours=hours)
+        offset_minutes = int(offset.total_seconds() // 60)
+
+        # Диапазонный запрос по индексу (is_active, deadline): только новое окно с прошлой проверки
+        tasks = session.query(Task, Project).join(Project, Project.id == Task.project_id).outerjoin(
+            TaskReminder,
+            (TaskReminder.task_id == Task.id) & (TaskReminder.offset_minutes == offset_minutes)
+        ).filter(
+            Task.is_active == True,
+            Task.deadline > since + offset,
+            Task.deadline <= until + offset,
+            TaskReminder.id == None
+        ).all()
+        if not tasks:
+            continue
+
+        task_ids = [task.id for task, _ in tasks]
+        approved = set(session.query(UserTask.user_id, UserTask.task_id).filter(
+            UserTask.task_id.in_(task_ids),
+            UserTask.status == 'approved'
+        ).all())
+        assignees = {}
+        for task_id, user_id in session.query(TaskAssignment.task_id, TaskAssignment.user_id).filter(
+            TaskAssignment.task_id.in_(task_ids)
+        ):
+            assignees.setdefault(task_id, []).append(user_id)
+
+        # Группируем задания по (пользователь, проект), чтобы отправить одно сообщение
+        grouped = {}
+        for task, project in tasks:
+            for user_id in assignees.get(task.id, []):
+                if (user_id, task.id) in approved:
+                    continue
+                grouped.setdefault((user_id, project.id), (project, []))[1].append(task)
+            session.add(TaskReminder(task_id=task.id, offset_minutes=offset_minutes))
+
+        for (user_id, _), (project, project_tasks) in grouped.items():
+            outbox.enqueue(
+                session, user_id,
+                notifications.deadline_reminder(project, project_tasks, hours),
+                message_type='reminder',
+                task_id=project_tasks[0].id
+            )
+            count += 1
+    return count
+
+# Ответы
+
+@db_call
+def get_user_answers(session, user_id, cursor=None, direction='next'):
+    """Возвращает страницу (ответ, задание, проект), новые ответы первыми"""
+    query = session.query(UserTask, Task, Project).join(
+        Task, Task.id == UserTask.task_id
+    ).join(
+        Project, Project.id == Task.project_id
+    ).filter(
+        UserTask.user_id == user_id
+    )
+    return keyset_page(query, UserTask.id, lambda row: row[0].id, cursor, direction, descending=True)
+
+@db_call
+def get_user_answer_detail(session, user_task_id):
+    """Возвращает (ответ, задание, проект) или None"""
+    return session.query(UserTask, Task, Project).join(
+        Task, Task.id == UserTask.task_id
+    ).join(
+        Project, Project.id == Task.project_id
+    ).filter(
+        UserTask.id == user_task_id
+    ).first()
+
+def _find_user_task(session, user_id, task_id):
+    return session.query(UserTask).filter(
+        UserTask.user_id == user_id,
+        UserTask.task_id == task_id
+    ).first()
+
+def _notify_admins(session, notification, digest_line, message_type, task_id):
+    """Уведомляет админов сразу или, в режиме сводки (ADMIN_DIGEST_MINUTES), откладывает событие"""
+    admin_ids = _admin_ids(session)
+    if not config.ADMIN_DIGEST_MINUTES:
+        for admin_id in admin_ids:
+            outbox.enqueue(session, admin_id, notification, message_type=message_type, task_id=task_id)
+        return
+
+    for admin_id in admin_ids:
+        outbox.hold_for_digest(session, admin_id, digest_line, message_type, task_id)
+    session.flush()
+    # Кому накопилось ADMIN_DIGEST_MAX_EVENTS событий - сводка сразу, не дожидаясь таймера
+    full = [
+        admin_id for admin_id, count in session.query(Notification.user_id, func.count(Notification.id)).filter(
+            Notification.status == 'digest',
+            Notification.user_id.in_(admin_ids)
+        ).group_by(Notification.user_id)
+        if count >= config.ADMIN_DIGEST_MAX_EVENTS
+    ]
+    if full:
+        outbox.flush_digests(session, user_ids=full)
+
+@db_call
+def flush_admin_digests(session, ready_before):
+    """Отправляет сводки админам, чьи самые старые события не новее ready_before"""
+    return outbox.flush_digests(session, ready_before=ready_before)
+
+@db_call
+def submit_task_answer(session, user_id, task_id, answer_text):
+    """Создает или обновляет ответ пользователя на задание и уведомляет админов"""
+    user_task = _find_user_task(session, user_id, task_id)
+
+    if not user_task:
+        # Создаем новый ответ; если параллельный запрос успел раньше - обновляем его ответ
+        try:
+            with session.begin_nested():
+                user_task = UserTask(user_id=user_id, task_id=task_id)
+                session.add(user_task)
+        except IntegrityError:
+            user_task = _find_user_task(session, user_id, task_id)
+
+    user_task.answer_text = answer_text
+    user_task.submitted_at = datetime.now()
+    user_task.status = 'pending'
+    user_task.feedback = None  # Сбрасываем фидбек при изменении
+    session.flush()
+
+    user = session.query(User).filter(User.id == user_id).first()
+    task = session.query(Task).filter(Task.id == task_id).first()
+    project = session.query(Project).filter(Project.id == task.project_id).first()
+    _notify_admins(
+        session, notifications.new_answer(project, task, user, user_task),
+        notifications.digest_answer_line(user), 'answer', task_id
+    )
+    return user_task
+
+@db_call
+def submit_clarification(session, user_id, task_id, question):
+    """Ставит вопрос пользователя по заданию в очередь уведомлений админам"""
+    user = session.query(User).filter(User.id == user_id).first()
+    task = session.query(Task).filter(Task.id == task_id).first()
+    project = session.query(Project).filter(Project.id == task.project_id).first()
+    _notify_admins(
+        session, notifications.clarification(project, task, user, question),
+        notifications.digest_clarification_line(user, question), 'clarification', task_id
+    )
+
+@db_call
+def review_answer(session, user_task_id, status, feedback=None):
+    """Меняет статус ответа и уведомляет автора; возвращает (ответ, автор, задание) или None"""
+    user_task = session.query(UserTask).filter(UserTask.id == user_task_id).first()
+    if not user_task:
+        return None
+
+    user_task.status = status
+    user_task.reviewed_at = datetime.now()
+    if feedback is not None:
+        user_task.feedback = feedback
+
+    user = session.query(User).filter(User.id == user_task.user_id).first()
+    task = session.query(Task).filter(Task.id == user_task.task_id).first()
+    message_type = 'feedback' if feedback else 'info'
+    outbox.enqueue(session, user.id, notifications.answer_reviewed(task, status, feedback),
+                   message_type=message_type, task_id=task.id)
+    return user_task, user, task
+
+@db_call
+def get_pending_answers_overview(session):
+    """Возвращает список (задание, ответов на проверке) одним сгруппированным запросом"""
+    return session.query(Task, func.count(UserTask.id)).join(
+        UserTask, UserTask.task_id == Task.id
+    ).filter(
+        UserTask.status == 'pending'
+    ).group_by(Task.id).order_by(Task.id).all()
+
+# Журнал действий админов
+
+@db_call
+def log_admin_action(session, admin_id, action_type, target_id, details):
+    admin_action = AdminAction(
+        admin_id=admin_id,
+        action_type=action_type,
+        target_id=target_id,
+        details=details
+    )
+    session.add(admin_action)
+    return admin_action
+
+# Состояние бота (persistence)
+
+@db_call
+def load_bot_state(session):
+    """Все сохраненные данные одним запросом: {kind: {key: data}}"""
+    state = {}
+    for row in session.query(BotState).all():
+        state.setdefault(row.kind, {})[row.key] = row.data
+    return state
+
+@db_call
+def save_bot_state(session, changes):
+    """Применяет пачку изменений {(kind, key): data}; data=None удаляет запись"""
+    by_kind = {}
+    for (kind, key), data in changes.items():
+        by_kind.setdefault(kind, {})[key] = data
+    for kind, items in by_kind.items():
+        rows = session.query(BotState).filter(BotState.kind == kind, BotState.key.in_(list(items))).all()
+        existing = {row.key: row for row in rows}
+        for key, data in items.items():
+            row = existing.get(key)
+            if data is None:
+                if row:
+                    session.delete(row)
+            elif row:
+                row.data = data
+            else:
+                session.add(BotState(kind=kind, key=key, data=data))
+
+# Служебное
+
+@db_call
+def ping_database(session):
+    """Проверка доступности БД для /healthz"""
+    session.execute(text("SELECT 1"))
@@ -0,0 +1,121 @@
+import logging
+import time
+import callback_codec as cd
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Типы аргументов в шаблонах маршрутов: {int}, {dir}, {str}
+def _parse_int(segment):
+    return int(segment) if segment.isdigit() else None
+
+def _parse_dir(segment):
+    return segment if segment in ('next', 'prev') else None
+
+def _parse_str(segment):
+    return segment or None
+
+CONVERTERS = {
+    'int': _parse_int,
+    'dir': _parse_dir,
+    'str': _parse_str,
+}
+
+class _Node:
+    __slots__ = ('literals', 'params', 'route')
+
+    def __init__(self):
+        self.literals = {}
+        self.params = []
+        self.route = None
+
+class CallbackRouter:
+    """Таблица маршрутов callback_data: дерево по сегментам, разделенным '_'.
+
+    Шаблон вида 'project_detail_{int}' регистрируется один раз при старте;
+    разбор идет за один проход по сегментам, аргументы приводятся к типам.
+    Компактная callback_data (callback_codec) разбирается по коду маршрута.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.root = _Node()
+        self.handlers = {}
+
+    def add(self, pattern, handler):
+        node = self.root
+        for segment in pattern.split('_'):
+            if segment.startswith('{') and segment.endswith('}'):
+                converter = CONVERTERS[segment[1:-1]]
+                for param_converter, child in node.params:
+                    if param_converter is converter:
+                        node = child
+                        break
+                else:
+                    child = _Node()
+                    node.params.append((converter, child))
+                    node = child
+            else:
+                node = node.literals.setdefault(segment, _Node())
+        if node.route is not None:
+            raise ValueError(f"Duplicate callback route: {pattern}")
+        node.route = (pattern, handler)
+        self.handlers[pattern] = handler
+        cd.register(pattern)
+
+    def match(self, data):
+        """Возвращает (шаблон, обработчик, аргументы) или None"""
+        if cd.is_encoded(data):
+            decoded = cd.decode(data)
+            if decoded is None or decoded[0] not in self.handlers:
+                return None
+            pattern, args = decoded
+            return pattern, self.handlers[pattern], args
+
+        # Строковая callback_data из сообщений, отправленных до перехода на codec
+        node = self.root
+        args = []
+        for segment in data.split('_'):
+            child = node.literals.get(segment)
+            if child is None:
+                for converter, param_child in node.params:
+                    value = converter(segment)
+                    if value is not None:
+                        args.append(value)
+                        child = param_child
+                        break
+                else:
+                    return None
+            node = child
+        if node.route is None:
+            return None
+        pattern, handler = node.route
+        return pattern, handler, args
+
+    def handles(self, data):
+        """Фильтр для CallbackQueryHandler(pattern=...): есть ли маршрут в этой таблице"""
+        if not isinstance(data, str):
+            return False
+        if cd.is_encoded(data):
+            decoded = cd.decode(data)
+            return decoded is not None and decoded[0] in self.handlers
+        return data.split('_', 1)[0] in self.root.literals
+
+    async def dispatch(self, data, *call_args):
+        """Вызывает handler(*call_args, *аргументы маршрута); (найден ли маршрут, результат)"""
+        matched = self.match(data)
+        if matched is None:
+            metrics.CALLBACK_MISSES.labels(self.name).inc()
+            logger.warning(f"Unknown callback in {self.name} router: {data}")
+            return False, None
+
+        pattern, handler, args = matched
+        started = time.perf_counter()
+        try:
+            return True, await handler(*call_args, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.CALLBACK_SECONDS.labels(self.name, pattern).observe(elapsed)
+            if elapsed * 1000 >= config.SLOW_CALLBACK_MS:
+                logger.warning(f"Slow callback {pattern}: {elapsed * 1000:.0f} ms")
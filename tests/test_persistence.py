@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_directory = tempfile.TemporaryDirectory(prefix='bot-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory.name, 'test.db')}"
+
+import database
+from persistence import SQLPersistence
+
+class SQLPersistenceTest(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        database.prepare_schema()
+
+    async def restart(self):
+        """Новый экземпляр, как после перезапуска бота"""
+        persistence = SQLPersistence()
+        return persistence, await persistence.get_user_data()
+
+    async def test_change_after_restart_is_saved(self):
+        persistence, user_data = await self.restart()
+        await persistence.update_user_data(1, {'state': 'waiting_broadcast_message'})
+        await persistence.flush()
+
+        persistence, user_data = await self.restart()
+        self.assertEqual(user_data[1], {'state': 'waiting_broadcast_message'})
+
+        # PTB меняет загруженный словарь на месте и передает его же в update_user_data
+        user_data[1].clear()
+        await persistence.update_user_data(1, user_data[1])
+        await persistence.flush()
+
+        persistence, user_data = await self.restart()
+        self.assertEqual(user_data[1], {})
+
+if __name__ == '__main__':
+    unittest.main()
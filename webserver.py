@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+import httpx
+import tornado.httpserver
+import tornado.web
+from telegram import Update
+import config
+import metrics
+import repository as repo
+
+logger = logging.getLogger(__name__)
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """Принимает апдейты от Telegram и кладет их в очередь приложения"""
+
+    def initialize(self, bot_application):
+        self.bot = bot_application.bot
+        self.update_queue = bot_application.update_queue
+
+    async def post(self):
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.bot)
+        except Exception as e:
+            logger.error(f"Error parsing webhook update: {e}")
+            raise tornado.web.HTTPError(400)
+        # При заполненной очереди ждем здесь - Telegram притормозит отправку
+        if update:
+            await self.update_queue.put(update)
+
+class HealthHandler(tornado.web.RequestHandler):
+    """Проверка живости для хостинга и самопинга: БД отвечает, сколько апдейтов в очереди"""
+
+    def initialize(self, bot_application):
+        self.update_queue = bot_application.update_queue
+
+    async def get(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(repo.ping_database(), config.HEALTH_DB_TIMEOUT)
+            database_ok = True
+        except Exception as e:
+            logger.error(f"Health check: database unavailable: {e}")
+            database_ok = False
+        if not database_ok:
+            self.set_status(503)
+        self.write({
+            'status': 'ok' if database_ok else 'degraded',
+            'database': database_ok,
+            'database_ms': round((time.perf_counter() - started) * 1000, 1),
+            'queue_depth': getattr(self.update_queue, 'unfinished', self.update_queue.qsize()),
+        })
+
+    head = get
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render())
+
+def make_app(application):
+    routes = [
+        (rf"/{config.BOT_TOKEN}/?", WebhookHandler, {'bot_application': application}),
+        (r"/healthz", HealthHandler, {'bot_application': application}),
+    ]
+    if config.METRICS_ENABLED:
+        routes.append((r"/metrics", MetricsHandler))
+    return tornado.web.Application(routes)
+
+async def self_ping(url, interval):
+    """Периодически запрашивает /healthz по внешнему адресу, чтобы хостинг не усыплял сервис.
+
+    Один клиент на все запросы: соединение переиспользуется между пингами.
+    """
+    async with httpx.AsyncClient(timeout=30) as client:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                response = await client.get(url)
+                logger.info(f"Self-ping status: {response.status_code}")
+            except Exception as e:
+                logger.error(f"Self-ping error: {e}")
+
+async def serve_webhook(application, webhook_url, port):
+    """Запускает бота в режиме webhook на своем HTTP-сервере (webhook, /healthz, /metrics)"""
+    server = tornado.httpserver.HTTPServer(make_app(application))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    # Порт открываем до инициализации: при холодном старте апдейты принимаются
+    # сразу и ждут в очереди, пока приложение запускается
+    server.listen(port, address="0.0.0.0")
+    try:
+        async with application:
+            if application.post_init:
+                await application.post_init(application)
+            await application.bot.set_webhook(
+                url=f"{webhook_url}/{config.BOT_TOKEN}",
+                drop_pending_updates=True
+            )
+            await application.start()
+            logger.info("Bot running in webhook mode")
+            pinger = None
+            if config.SELF_PING_INTERVAL > 0:
+                pinger = asyncio.create_task(self_ping(f"{webhook_url}/healthz", config.SELF_PING_INTERVAL))
+            try:
+                await stop.wait()
+            finally:
+                if pinger:
+                    pinger.cancel()
+                # Фоновые отправки останавливаем, пока бот еще может отправлять
+                if application.post_stop:
+                    await application.post_stop(application)
+                await application.stop()
+    finally:
+        server.stop()
+
+    if application.post_shutdown:
+        await application.post_shutdown(application)